@@ -1,8 +1,543 @@
+import hashlib
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Case, IntegerField, Prefetch, QuerySet, When
+from django.http import Http404, StreamingHttpResponse
+from django.urls import path
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import replace_query_param
+from wagtail.api.v2.filters import BaseFilterBackend
+from wagtail.api.v2.pagination import WagtailPagination
 from wagtail.api.v2.router import WagtailAPIRouter
+from wagtail.api.v2.utils import BadRequestError, parse_fields_parameter
 from wagtail.api.v2.views import PagesAPIViewSet
 from wagtail.documents.api.v2.views import DocumentsAPIViewSet
 from wagtail.images.api.v2.views import ImagesAPIViewSet
 
+from bakerydemo.base.cache import get_generation, is_cache_shared
+from bakerydemo.base.pagination import InvalidCursor, KeysetPaginator
+from bakerydemo.locations.geo import parse_lat_long
+from bakerydemo.locations.models import get_location_index
+from bakerydemo.recipes.models import RecipePage
+from bakerydemo.recipes.summary import get_summary_filters
+
+API_CACHE_KEY = "bakerydemo:api:{}:{}"
+API_CACHE_TIMEOUT = 60 * 60
+
+# Query parameters that don't change the data of a response: "_" is only
+# there to bust browser caches, and "format" picks the renderer
+IGNORED_CACHE_PARAMETERS = {"_", "format"}
+
+
+class CachedResponseMixin:
+    """
+    Caches the serialized data of the listing and detail responses of an
+    endpoint, keyed by the host, path and query parameters of the request,
+    so that repeated queries are answered without touching the database.
+
+    The entries are invalidated by tags: each tag is a generation (see
+    base/cache.py) that is part of the cache keys of the endpoints listing
+    it in `cache_tags`, and that invalidate_api_cache() (also in
+    base/cache.py) bumps when the objects change (see
+    base/signal_handlers.py).
+
+    The validators (ETag and Last-Modified) of the responses are cached
+    with their data, so that conditional requests for cached responses are
+    answered without touching the database either. The mixin has to come
+    before ConditionalResponseMixin for that.
+
+    The generations have to be seen by all the processes serving the API,
+    so the responses are only cached when the default cache is shared
+    between them (see CACHES in settings/base.py).
+    """
+
+    cache_tags = []
+    cached_headers = ["ETag", "Last-Modified"]
+
+    def get_cache_key(self, request):
+        parts = [get_generation(f"api:{tag}") for tag in self.cache_tags]
+        digest = hashlib.md5(
+            "\n".join(parts + get_request_signature(request)).encode()
+        ).hexdigest()
+        return API_CACHE_KEY.format(self.name, digest)
+
+    def get_cached_response(self, request, view, *args, **kwargs):
+        if not is_cache_shared():
+            return view(request, *args, **kwargs)
+
+        key = self.get_cache_key(request)
+        entry = cache.get(key)
+        if entry is not None:
+            data, headers = entry
+            last_modified = headers.get("Last-Modified")
+            if last_modified is not None:
+                last_modified = parse_http_date_safe(last_modified)
+            response = get_conditional_response(
+                request, etag=headers.get("ETag"), last_modified=last_modified
+            )
+            if response is None:
+                response = Response(data)
+            for name, value in headers.items():
+                response[name] = value
+            return response
+
+        response = view(request, *args, **kwargs)
+        # Only cache the successful responses, errors are cheap anyway
+        if response.status_code == 200:
+            headers = {
+                name: response[name]
+                for name in self.cached_headers
+                if response.has_header(name)
+            }
+            cache.set(key, (response.data, headers), API_CACHE_TIMEOUT)
+        return response
+
+    def listing_view(self, request):
+        return self.get_cached_response(request, super().listing_view)
+
+    def detail_view(self, request, pk):
+        return self.get_cached_response(request, super().detail_view, pk)
+
+
+def get_request_signature(request):
+    # The parts of the request that the data of an API response depends on.
+    # Pages are found from the site of the request, and the URLs in the
+    # responses are absolute.
+    params = sorted(
+        (name, value)
+        for name, values in request.GET.lists()
+        if name not in IGNORED_CACHE_PARAMETERS
+        for value in values
+    )
+    return [request.scheme, request.get_host(), request.path, repr(params)]
+
+
+class ConditionalResponseMixin:
+    """
+    Answers the If-None-Match and If-Modified-Since headers of listing and
+    detail requests with a 304 when the objects of the response haven't
+    changed, without serializing them.
+
+    The ETag is computed from the `validator_fields` of the objects of the
+    response (of the requested page of a listing, with the total count or
+    the cursors of the neighbouring pages) and the generations of the
+    endpoint's cache tags, and the Last-Modified of detail responses from
+    their `last_modified_field`, if any. That takes one or two small
+    queries, rather than fetching and serializing the objects, and is only
+    done when the response isn't cached (see CachedResponseMixin).
+
+    As the related objects of the responses are only versioned by the
+    generations, endpoints with cache tags have no validators unless the
+    default cache is shared between processes.
+    """
+
+    validator_fields = ["pk"]
+    last_modified_field = None
+
+    def get_validators(self, request, pk=None):
+        """
+        Returns the `(etag, last_modified)` of the response to the request,
+        or None if they can't be computed cheaply (e.g. for search results)
+        or reliably, or the request isn't valid.
+        """
+        if self.cache_tags and not is_cache_shared():
+            return None
+
+        try:
+            queryset = self.get_queryset()
+            if pk is None:
+                self.check_query_parameters(queryset)
+                queryset = self.filter_queryset(queryset)
+        except (BadRequestError, Http404):
+            return None
+        # Search results and random orderings can't be revalidated
+        if not isinstance(queryset, QuerySet) or request.GET.get("order") == "random":
+            return None
+
+        rows = queryset.values_list(*self.validator_fields)
+        if pk is None:
+            paginator = self.pagination_class()
+            try:
+                ordering = None
+                if isinstance(paginator, CursorPagination):
+                    ordering = paginator.get_ordering(request, self)
+                if ordering is not None:
+                    # Pages requested by cursor are found by the values of
+                    # the fields they're ordered by, and have no total count
+                    fields = [field.lstrip("-") for field in ordering]
+                    rows = queryset.values(*self.validator_fields, *fields)
+                rows = list(paginator.paginate_queryset(rows, request, self))
+            except BadRequestError:
+                return None
+            if ordering is not None:
+                page = paginator.page
+                version = [page.next_cursor, page.previous_cursor, rows]
+            else:
+                version = [paginator.total_count, rows]
+        else:
+            rows = list(rows.filter(pk=pk))
+            if not rows:
+                return None
+            version = rows
+        # Related objects (e.g. the origin of a bread) can change without the
+        # objects themselves changing, but they bump the cache tags
+        version += [get_generation(f"api:{tag}") for tag in self.cache_tags]
+
+        etag = quote_etag(
+            hashlib.md5(
+                repr(get_request_signature(request) + version).encode()
+            ).hexdigest()
+        )
+        # Listings can lose objects without any timestamp changing, so only
+        # their ETag (which includes the total count) can be relied on
+        last_modified = None
+        if pk is not None and self.last_modified_field:
+            value = rows[0][self.validator_fields.index(self.last_modified_field)]
+            if value is not None:
+                # HTTP dates have a precision of one second
+                last_modified = int(value.timestamp())
+        return etag, last_modified
+
+    def get_conditional_response(self, request, view, *args, **kwargs):
+        validators = self.get_validators(request, *args)
+        if validators is None:
+            return view(request, *args, **kwargs)
+
+        etag, last_modified = validators
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is not None:
+            return response
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200:
+            response["ETag"] = etag
+            if last_modified is not None:
+                response["Last-Modified"] = http_date(last_modified)
+        return response
+
+    def listing_view(self, request):
+        return self.get_conditional_response(request, super().listing_view)
+
+    def detail_view(self, request, pk):
+        return self.get_conditional_response(request, super().detail_view, pk)
+
+
+def get_relation_lookups(serializer_class, prefix="", prefetch=False):
+    """
+    Returns the `(select_related, prefetch_related)` lookups of the relations
+    that a Wagtail API serializer class serializes, including those of its
+    nested serializers (e.g. ?fields=origin,ingredients on breads).
+
+    Foreign keys are joined with select_related, and many-to-many and child
+    relations (and everything below them) are prefetched, so that
+    serializing any number of objects takes a fixed number of queries.
+    """
+    model = serializer_class.Meta.model
+    select_related, prefetch_related = [], []
+    for name in serializer_class.Meta.fields:
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+        if not field.is_relation:
+            continue
+
+        lookup = prefix + name
+        to_many = field.many_to_many or field.one_to_many
+        # Relations serialized with LiveRelationField only need their live
+        # objects
+        live_lookup = getattr(
+            serializer_class._declared_fields.get(name), "live_lookup", None
+        )
+        if live_lookup is not None:
+            queryset = field.related_model._default_manager.filter(
+                **{live_lookup: True}
+            )
+            prefetch_related.append(Prefetch(lookup, queryset=queryset))
+        elif prefetch or to_many:
+            prefetch_related.append(lookup)
+        else:
+            select_related.append(lookup)
+
+        child_serializer_class = serializer_class.child_serializer_classes.get(name)
+        if child_serializer_class is not None:
+            child_select_related, child_prefetch_related = get_relation_lookups(
+                child_serializer_class, f"{lookup}__", prefetch or to_many
+            )
+            select_related += child_select_related
+            prefetch_related += child_prefetch_related
+    return select_related, prefetch_related
+
+
+def fetch_serialized_relations(queryset, serializer_class):
+    select_related, prefetch_related = get_relation_lookups(serializer_class)
+    return queryset.select_related(*select_related).prefetch_related(*prefetch_related)
+
+
+class RelatedFieldsMixin:
+    """
+    Fetches the relations serialized in the listing of an endpoint along with
+    its objects, see get_relation_lookups().
+    """
+
+    def paginate_queryset(self, queryset):
+        # Search results can't be prefetched
+        if isinstance(queryset, QuerySet):
+            queryset = fetch_serialized_relations(queryset, self.get_serializer_class())
+        return super().paginate_queryset(queryset)
+
+
+class ExportMixin:
+    """
+    Adds an export/ view to an endpoint, which streams all the objects of the
+    listing (with the same filters, ordering and fields) as newline-delimited
+    JSON. Unlike paging through the listing with offset and limit, the
+    objects are fetched by a single query and serialized in chunks (read
+    from a server-side cursor on PostgreSQL), so memory use doesn't grow
+    with the size of the export.
+    """
+
+    export_chunk_size = 500
+
+    @classmethod
+    def get_urlpatterns(cls):
+        return super().get_urlpatterns() + [
+            path("export/", cls.as_view({"get": "export_view"}), name="export"),
+        ]
+
+    def export_view(self, request):
+        queryset = self.get_queryset()
+        self.check_query_parameters(queryset)
+        if "search" in request.GET:
+            raise BadRequestError("search can't be used in exports")
+        queryset = self.filter_queryset(queryset)
+
+        # The fields of the listing, as the listing view would serialize them
+        try:
+            fields_config = parse_fields_parameter(request.GET.get("fields", ""))
+        except ValueError as e:
+            raise BadRequestError(f"fields error: {e}")
+        serializer_class = self._get_serializer_class(
+            request.wagtailapi_router, queryset.model, fields_config
+        )
+        # Prefetches are done chunk by chunk
+        queryset = fetch_serialized_relations(queryset, serializer_class)
+        context = self.get_serializer_context()
+        encoder = JSONEncoder()
+
+        def lines():
+            for obj in queryset.iterator(chunk_size=self.export_chunk_size):
+                data = serializer_class(obj, context=context).data
+                yield encoder.encode(data) + "\n"
+
+        return StreamingHttpResponse(lines(), content_type="application/x-ndjson")
+
+
+class NearFilter(BaseFilterBackend):
+    """
+    Implements the ?near=lat,long filter, with an optional ?radius in
+    kilometres. Only the live locations within the radius are returned,
+    closest first, using the in-memory index of locations.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        if "near" not in request.GET:
+            if "radius" in request.GET:
+                raise BadRequestError("radius can only be used with near")
+            return queryset
+
+        try:
+            latitude, longitude = parse_lat_long(request.GET["near"])
+        except ValueError:
+            raise BadRequestError(
+                "near must be a comma-separated latitude and longitude"
+            )
+        try:
+            radius = float(request.GET["radius"]) if "radius" in request.GET else None
+        except ValueError:
+            raise BadRequestError("radius must be a number")
+
+        nearest = get_location_index().nearest(latitude, longitude, radius_km=radius)
+        ids = [pk for pk, _ in nearest]
+        if not ids:
+            return queryset.none()
+        return queryset.filter(pk__in=ids).order_by(
+            Case(
+                *[When(pk=pk, then=position) for position, pk in enumerate(ids)],
+                output_field=IntegerField(),
+            )
+        )
+
+
+class RecipeSummaryFilter(BaseFilterBackend):
+    """
+    Implements the ?difficulty=S|M|L, ?max_steps, ?max_ingredients and
+    ?max_average_difficulty filters on recipes, using the summary fields of
+    RecipePage rather than the recipe bodies. Other pages are excluded when
+    they are used.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        try:
+            filters = get_summary_filters(request.GET)
+        except ValueError:
+            raise BadRequestError(
+                "difficulty must be one of S, M or L, max_steps and "
+                "max_ingredients must be whole numbers, and "
+                "max_average_difficulty must be a non-negative number"
+            )
+        if not filters:
+            return queryset
+
+        if issubclass(queryset.model, RecipePage):
+            return RecipePage.filter_by_summary(queryset, **filters)
+        recipes = RecipePage.filter_by_summary(RecipePage.objects.all(), **filters)
+        return queryset.filter(pk__in=recipes.values("pk"))
+
+
+class CursorPagination(WagtailPagination):
+    """
+    Adds a cursor mode to the offset and limit pagination of a listing: with
+    ?cursor (empty for the first page), the objects are ordered by one of
+    the `cursor_orderings` of the endpoint, picked with ?cursor_key, and
+    each page starts after the last object of the previous one (see
+    KeysetPaginator). Unlike offsets, that costs the same however deep the
+    page is, and no total count is computed.
+
+    The response meta has the `next_cursor` and `previous_cursor` of the
+    neighbouring pages and their URLs, `next` and `previous` (null on the
+    first and last pages).
+    """
+
+    def get_limit(self, request):
+        limit_max = getattr(settings, "WAGTAILAPI_LIMIT_MAX", 20)
+        try:
+            limit = int(request.GET.get("limit", min(20, limit_max or 20)))
+            if limit < 0:
+                raise ValueError()
+        except ValueError:
+            raise BadRequestError("limit must be a positive integer")
+        if limit_max and limit > limit_max:
+            raise BadRequestError(f"limit cannot be higher than {limit_max}")
+        return limit
+
+    def get_ordering(self, request, view):
+        """
+        Returns the ordering of the listing requested by cursor, or None if
+        it isn't requested by cursor.
+        """
+        if "cursor" not in request.GET:
+            if "cursor_key" in request.GET:
+                raise BadRequestError("cursor_key can only be used with cursor")
+            return None
+        # These change the objects or the order of the listing, which the
+        # cursors can't follow
+        for name in ("offset", "order", "search", "near"):
+            if name in request.GET:
+                raise BadRequestError(f"{name} can't be used with cursor")
+        orderings = view.cursor_orderings
+        key = request.GET.get("cursor_key", next(iter(orderings)))
+        if key not in orderings:
+            raise BadRequestError(
+                "cursor_key must be one of " + ", ".join(sorted(orderings))
+            )
+        return orderings[key]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = self.get_ordering(request, view)
+        if ordering is None:
+            self.page = None
+            return super().paginate_queryset(queryset, request, view)
+
+        paginator = KeysetPaginator(queryset, self.get_limit(request), ordering)
+        try:
+            self.page = paginator.page(request.GET["cursor"])
+        except InvalidCursor:
+            raise BadRequestError("cursor isn't valid")
+        self.request = request
+        self.view = view
+        return self.page.object_list
+
+    def get_page_url(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, "cursor", cursor)
+
+    def get_paginated_response(self, data):
+        if self.page is None:
+            return super().get_paginated_response(data)
+        meta = OrderedDict(
+            [
+                ("next_cursor", self.page.next_cursor),
+                ("previous_cursor", self.page.previous_cursor),
+                ("next", self.get_page_url(self.page.next_cursor)),
+                ("previous", self.get_page_url(self.page.previous_cursor)),
+            ]
+        )
+        return Response(OrderedDict([("meta", meta), ("items", data)]))
+
+
+class BakeryPagesAPIViewSet(
+    ExportMixin,
+    CachedResponseMixin,
+    ConditionalResponseMixin,
+    RelatedFieldsMixin,
+    PagesAPIViewSet,
+):
+    # Pages can include image renditions
+    cache_tags = ["pages", "images"]
+    validator_fields = ["pk", "last_published_at"]
+    last_modified_field = "last_published_at"
+    pagination_class = CursorPagination
+    # The orderings of ?cursor_key, the first one being the default. Both
+    # are indexed (last_published_at by base/migrations/0021).
+    cursor_orderings = {
+        "path": ("path",),
+        "last_published_at": ("-last_published_at", "-id"),
+    }
+    filter_backends = PagesAPIViewSet.filter_backends + [
+        NearFilter,
+        RecipeSummaryFilter,
+    ]
+    known_query_parameters = PagesAPIViewSet.known_query_parameters.union(
+        [
+            "near",
+            "radius",
+            "difficulty",
+            "max_steps",
+            "max_ingredients",
+            "max_average_difficulty",
+            "cursor",
+            "cursor_key",
+        ]
+    )
+
+
+class BakeryImagesAPIViewSet(
+    CachedResponseMixin, ConditionalResponseMixin, RelatedFieldsMixin, ImagesAPIViewSet
+):
+    cache_tags = ["images"]
+    validator_fields = ["pk", "title", "file_hash"]
+
+
+class BakeryDocumentsAPIViewSet(
+    CachedResponseMixin,
+    ConditionalResponseMixin,
+    RelatedFieldsMixin,
+    DocumentsAPIViewSet,
+):
+    cache_tags = ["documents"]
+    validator_fields = ["pk", "title", "file_hash"]
+
+
 # Create the router. "wagtailapi" is the URL namespace
 api_router = WagtailAPIRouter("wagtailapi")
 
@@ -10,6 +545,6 @@ api_router = WagtailAPIRouter("wagtailapi")
 # The first parameter is the name of the endpoint (eg. pages, images). This
 # is used in the URL of the endpoint
 # The second parameter is the endpoint class that handles the requests
-api_router.register_endpoint("pages", PagesAPIViewSet)
-api_router.register_endpoint("images", ImagesAPIViewSet)
-api_router.register_endpoint("documents", DocumentsAPIViewSet)
+api_router.register_endpoint("pages", BakeryPagesAPIViewSet)
+api_router.register_endpoint("images", BakeryImagesAPIViewSet)
+api_router.register_endpoint("documents", BakeryDocumentsAPIViewSet)
@@ -0,0 +1,53 @@
+from uuid import uuid4
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+GENERATION_CACHE_KEY = "bakerydemo:generation:{}"
+# The tokens expire so that a process that missed a bump (e.g. with a cache
+# that isn't shared between processes, see CACHES in settings/base.py) only
+# serves stale entries for a bounded time
+GENERATION_CACHE_TIMEOUT = 60 * 60
+
+
+def get_generation(name):
+    """
+    Returns the current generation token for `name`.
+
+    Cache entries that include the token in their keys are invalidated all at
+    once by `bump_generation`, without having to know which keys exist.
+    """
+    key = GENERATION_CACHE_KEY.format(name)
+    generation = cache.get(key)
+    if generation is None:
+        generation = uuid4().hex
+        # Another process may have set the token in the meantime
+        if not cache.add(key, generation, GENERATION_CACHE_TIMEOUT):
+            generation = cache.get(key, generation)
+    return generation
+
+
+def bump_generation(name):
+    # A random token rather than a counter, so that a token evicted from the
+    # cache can never come back with a value that was already used.
+    cache.set(GENERATION_CACHE_KEY.format(name), uuid4().hex, GENERATION_CACHE_TIMEOUT)
+
+
+def invalidate_api_cache(*tags):
+    # The API endpoints include the generations of their cache tags in the
+    # keys of their cached responses, see CachedResponseMixin in
+    # bakerydemo/api.py
+    for tag in tags:
+        bump_generation(f"api:{tag}")
+
+
+def is_cache_shared():
+    """
+    Returns whether the default cache is shared between processes, i.e. a
+    generation bumped by one process is seen by the others.
+
+    Features that can't fall back on a timeout for consistency (e.g. the
+    validators of the API responses) are only enabled when it is.
+    """
+    return not isinstance(caches["default"], (LocMemCache, DummyCache))
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+from wagtail.coreutils import get_supported_content_language_variant
+from wagtail.templatetags.wagtailcore_tags import richtext
+
+from bakerydemo.base.cache import bump_generation
+from bakerydemo.base.models import FooterText
+
+FOOTER_CACHE_TIMEOUT = 60 * 60
+FOOTER_CACHE_KEY = "bakerydemo:footer_text:{}"
+
+
+def render_footer_text(language_code):
+    """
+    Returns the rendered body of the live `FooterText` for `language_code`,
+    falling back to any live `FooterText` if it hasn't been translated.
+    """
+    live = FooterText.objects.filter(live=True)
+    instance = live.filter(locale__language_code=language_code).first()
+    if instance is None:
+        instance = live.first()
+    return str(richtext(instance.body)) if instance else ""
+
+
+def get_footer_html():
+    """
+    Returns the footer text HTML for the active language. The rich text is
+    only expanded when the cache is cold, so rendering the footer costs a
+    single cache lookup.
+    """
+    language_code = get_supported_content_language_variant(get_language())
+    key = FOOTER_CACHE_KEY.format(language_code)
+    html = cache.get(key)
+    if html is None:
+        html = render_footer_text(language_code)
+        cache.set(key, html, FOOTER_CACHE_TIMEOUT)
+    return mark_safe(html)
+
+
+def invalidate_footer_html():
+    # Locales without their own footer text fall back to another locale's,
+    # so drop all of them. The generation tells the pages that revalidate
+    # their rendered HTML (e.g. the blog tag archives) that it changed.
+    bump_generation("footer_text")
+    cache.delete_many(
+        [
+            FOOTER_CACHE_KEY.format(language_code)
+            for language_code, _ in settings.WAGTAIL_CONTENT_LANGUAGES
+        ]
+    )
@@ -2,11 +2,16 @@ import random
 from pathlib import Path
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router, transaction
 from django.utils import lorem_ipsum, timezone
 from django.utils.text import slugify
+from treebeard.numconv import int2str, str2int
 from wagtail.images.models import Image
+from wagtail.models import Page
 from wagtail.rich_text import RichText
+from wagtail.search.backends import get_search_backends
 from willow.image import Image as WillowImage
 
 from bakerydemo.base.models import FooterText, HomePage, Person, StandardPage
@@ -42,6 +47,18 @@ class Command(BaseCommand):
             type=int,
             help="How many images to create",
         )
+        parser.add_argument(
+            "--bulk",
+            action="store_true",
+            help="Insert the pages in batches, bypassing Page.save(). Much faster "
+            "for large page counts, but no revisions are created.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="How many pages to insert at once with --bulk",
+        )
 
     def fake_stream_field(self):
         return [("paragraph_block", RichText("\n".join(lorem_ipsum.paragraphs(5))))]
@@ -52,6 +69,28 @@ class Command(BaseCommand):
     def make_title(self):
         return lorem_ipsum.words(4, common=False)
 
+    def get_random_pools(self):
+        # With --bulk, random related objects are picked from the primary keys
+        # fetched here once, rather than with an `ORDER BY ?` query per page.
+        return {
+            "image": list(Image.objects.values_list("pk", flat=True)),
+            "country": list(Country.objects.values_list("pk", flat=True)),
+            "bread_type": list(BreadType.objects.values_list("pk", flat=True)),
+        }
+
+    def pick(self, pool):
+        return random.choice(pool) if pool else None
+
+    def make_slug(self, title, slugs):
+        # Sibling pages must have unique slugs
+        slug = base_slug = slugify(title)
+        suffix = 1
+        while slug in slugs:
+            suffix += 1
+            slug = f"{base_slug}-{suffix}"
+        slugs.add(slug)
+        return slug
+
     def create_pages(self, page_count):
         self.stdout.write("Creating bread pages...")
         breads_index = BreadsIndexPage.objects.live().first()
@@ -125,6 +164,168 @@ class Command(BaseCommand):
                 )
             )
 
+    def bulk_create_pages(self, parent, model, page_count, get_fields):
+        """
+        Creates `page_count` pages of `model` under `parent`, with the field
+        values returned by `get_fields()`, in batches of `self.batch_size`.
+
+        The treebeard path, depth and URL path of each page are computed here
+        instead of calling `add_child()` for every page, so that each batch
+        only costs a couple of INSERT queries. The numchild of the parents is
+        left for `Page.fix_tree()` to update once all the pages are created.
+        """
+        content_type = ContentType.objects.get_for_model(model)
+        depth = parent.depth + 1
+        # Not parent.get_children(), which relies on parent.numchild
+        children = Page.objects.filter(path__startswith=parent.path, depth=depth)
+        last_child = children.order_by("path").last()
+        # Each step of a path is a number in base len(Page.alphabet), padded
+        # to Page.steplen characters
+        radix = len(Page.alphabet)
+
+        def get_step(number):
+            step = int2str(number, radix, Page.alphabet)
+            return step.rjust(Page.steplen, Page.alphabet[0])
+
+        first_step = (
+            str2int(last_child.path[-Page.steplen :], radix, Page.alphabet) + 1
+            if last_child
+            else 1
+        )
+        if len(get_step(first_step + page_count - 1)) > Page.steplen:
+            raise CommandError(f"Too many children for {parent.title!r}")
+        slugs = set(children.values_list("slug", flat=True))
+        now = timezone.now()
+
+        for start in range(0, page_count, self.batch_size):
+            pages = []
+            for step in range(start, min(start + self.batch_size, page_count)):
+                title = self.make_title()
+                slug = self.make_slug(title, slugs)
+                pages.append(
+                    model(
+                        title=title,
+                        draft_title=title,
+                        slug=slug,
+                        content_type=content_type,
+                        path=parent.path + get_step(first_step + step),
+                        depth=depth,
+                        numchild=0,
+                        url_path=f"{parent.url_path}{slug}/",
+                        locale_id=parent.locale_id,
+                        live=True,
+                        first_published_at=now,
+                        last_published_at=now,
+                        **get_fields(),
+                    )
+                )
+            self.bulk_insert_pages(model, pages)
+
+    def bulk_insert_pages(self, model, pages):
+        using = router.db_for_write(model)
+        with transaction.atomic(using=using):
+            # bulk_create() doesn't support multi-table inheritance, so insert
+            # the rows of the wagtailcore_page table first...
+            Page.objects.using(using).bulk_create(pages, batch_size=self.batch_size)
+
+            # ...then, once we know their ids, the rows of the specific table.
+            # The ids are looked up by path as not all databases return them
+            # from bulk inserts.
+            ids = dict(
+                Page.objects.using(using)
+                .filter(path__in=[page.path for page in pages])
+                .values_list("path", "pk")
+            )
+            for page in pages:
+                page.id = page.page_ptr_id = ids[page.path]
+
+            fields = model._meta.local_concrete_fields
+            batch_size = connections[using].ops.bulk_batch_size(fields, pages)
+            for start in range(0, len(pages), batch_size):
+                model._base_manager.using(using)._insert(
+                    pages[start : start + batch_size], fields=fields, using=using
+                )
+
+        # Pages created by Page.save() are indexed by a signal handler, which
+        # isn't called for bulk inserts.
+        for backend in get_search_backends(with_auto_update=True):
+            backend.add_bulk(model, pages)
+
+    def bulk_create_all_pages(self, page_count):
+        pools = self.get_random_pools()
+
+        self.stdout.write("Creating bread pages...")
+        self.bulk_create_pages(
+            BreadsIndexPage.objects.live().first(),
+            BreadPage,
+            page_count,
+            lambda: {
+                "introduction": lorem_ipsum.paragraph(),
+                "bread_type_id": self.pick(pools["bread_type"]),
+                "body": self.fake_stream_field(),
+                "origin_id": self.pick(pools["country"]),
+                "image_id": self.pick(pools["image"]),
+            },
+        )
+
+        self.stdout.write("Creating location pages...")
+        self.bulk_create_pages(
+            LocationsIndexPage.objects.live().first(),
+            LocationPage,
+            page_count,
+            lambda: {
+                "introduction": lorem_ipsum.paragraph(),
+                "image_id": self.pick(pools["image"]),
+                "address": lorem_ipsum.paragraph(),
+                "body": self.fake_stream_field(),
+                "lat_long": "64.144367, -21.939182",
+                # Normally parsed from lat_long by LocationPage.save()
+                "latitude": 64.144367,
+                "longitude": -21.939182,
+            },
+        )
+
+        self.stdout.write("Creating blog pages...")
+        self.bulk_create_pages(
+            BlogIndexPage.objects.live().first(),
+            BlogPage,
+            page_count,
+            lambda: {
+                "introduction": lorem_ipsum.paragraph(),
+                "body": self.fake_stream_field(),
+                "subtitle": lorem_ipsum.words(10, common=False),
+                "date_published": timezone.now(),
+            },
+        )
+
+        self.stdout.write("Creating standard pages...")
+        homepage = HomePage.objects.live().first()
+        title = self.make_title()
+        # Nest the standard pages under a top level one
+        top_level_page = homepage.add_child(
+            instance=StandardPage(
+                title=title,
+                slug=slugify(title),
+                introduction=lorem_ipsum.paragraph(),
+                image_id=self.pick(pools["image"]),
+                body=self.fake_stream_field(),
+            )
+        )
+        self.bulk_create_pages(
+            top_level_page,
+            StandardPage,
+            page_count,
+            lambda: {
+                "introduction": lorem_ipsum.paragraph(),
+                "image_id": self.pick(pools["image"]),
+                "body": self.fake_stream_field(),
+            },
+        )
+
+        # Update the numchild of the parents of the inserted pages (and check
+        # the depth of all pages), in a few queries over the whole tree
+        Page.fix_tree()
+
     def create_snippets(self, snippet_count):
         self.stdout.write("Creating countries...")
         for _ in range(snippet_count):
@@ -170,6 +371,11 @@ class Command(BaseCommand):
                 image.file.save(random_image.name, image_file)
 
     def handle(self, **options):
+        self.batch_size = options["batch_size"]
+
         self.create_images(options["image_count"])
         self.create_snippets(options["snippet_count"])
-        self.create_pages(options["page_count"])
+        if options["bulk"]:
+            self.bulk_create_all_pages(options["page_count"])
+        else:
+            self.create_pages(options["page_count"])
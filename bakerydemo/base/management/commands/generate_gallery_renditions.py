@@ -0,0 +1,49 @@
+import logging
+
+from django.core.management.base import BaseCommand
+from wagtail.images.models import Image
+
+from bakerydemo.base.templatetags.gallery_tags import (
+    get_gallery_filters,
+    get_gallery_picture,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the missing gallery renditions of the images, so that "
+        "galleries don't have to generate them while rendering"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--collection",
+            type=int,
+            action="append",
+            help="Only generate the renditions of the images of this collection "
+            "(can be given several times)",
+        )
+
+    def handle(self, **options):
+        filters = get_gallery_filters()
+        images = Image.objects.order_by("pk").prefetch_renditions(*filters)
+        if options["collection"]:
+            images = images.filter(collection__in=options["collection"])
+
+        generated = failed = 0
+        for image in images.iterator(chunk_size=100):
+            if get_gallery_picture(image, filters) is not None:
+                continue
+            try:
+                get_gallery_picture(image, filters, generate=True)
+            except Exception:
+                logger.exception("Could not generate renditions of %r", image)
+                failed += 1
+            else:
+                generated += 1
+
+        self.stdout.write(
+            f"Generated the renditions of {generated} images ({failed} failed)"
+        )
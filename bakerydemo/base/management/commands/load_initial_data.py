@@ -1,4 +1,6 @@
+import hashlib
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from django.conf import settings
 from django.core.files.storage import FileSystemStorage, default_storage
@@ -8,19 +10,85 @@ from wagtail.models import Page, Site
 
 
 class Command(BaseCommand):
-    def _copy_files(self, local_storage, path):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=min(32, (os.cpu_count() or 1) + 4),
+            help="How many media files to copy to the configured storage at once",
+        )
+        parser.add_argument(
+            "--check-hash",
+            action="store_true",
+            help="Compare the contents of media files that already exist in the "
+            "configured storage, rather than only their size, before skipping them",
+        )
+
+    def _list_files(self, local_storage, path):
         """
-        Recursively copy files from local_storage to default_storage. Used
-        to automatically bootstrap the media directory (both locally and on
-        cloud providers) with the images linked from the initial data (and
-        included in MEDIA_ROOT).
+        Recursively list the files in local_storage, as paths relative to its
+        root.
         """
         directories, file_names = local_storage.listdir(path)
         for directory in directories:
-            self._copy_files(local_storage, path + directory + "/")
+            yield from self._list_files(local_storage, path + directory + "/")
         for file_name in file_names:
-            with local_storage.open(path + file_name) as file_:
-                default_storage.save(path + file_name, file_)
+            yield path + file_name
+
+    def _file_hash(self, storage, name):
+        digest = hashlib.sha256()
+        with storage.open(name) as file_:
+            for chunk in file_.chunks():
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _copy_file(self, local_storage, name, check_hash):
+        """
+        Copy a single file from local_storage to default_storage, unless an
+        identical file is already there. Returns whether the file was copied.
+        """
+        if default_storage.exists(name):
+            if default_storage.size(name) == local_storage.size(name) and (
+                not check_hash
+                or self._file_hash(default_storage, name)
+                == self._file_hash(local_storage, name)
+            ):
+                return False
+            # Storage.save() would pick another name rather than overwrite
+            default_storage.delete(name)
+        with local_storage.open(name) as file_:
+            default_storage.save(name, file_)
+        return True
+
+    def _copy_files(self, local_storage, workers=1, check_hash=False):
+        """
+        Copy files from local_storage to default_storage. Used to
+        automatically bootstrap the media directory (both locally and on
+        cloud providers) with the images linked from the initial data (and
+        included in MEDIA_ROOT).
+
+        The files are copied by a pool of threads, as the time is mostly spent
+        waiting on the storage, and files already in the storage with the same
+        size (and hash, if check_hash is set) are skipped so that running the
+        command again only copies what's missing.
+        """
+        names = list(self._list_files(local_storage, ""))
+        copied = skipped = 0
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            futures = [
+                executor.submit(self._copy_file, local_storage, name, check_hash)
+                for name in names
+            ]
+            for done, future in enumerate(as_completed(futures), 1):
+                if future.result():
+                    copied += 1
+                else:
+                    skipped += 1
+                if done % 100 == 0 or done == len(names):
+                    self.stdout.write(
+                        f"  {done}/{len(names)} files ({copied} copied, "
+                        f"{skipped} already up to date)"
+                    )
 
     def handle(self, **options):
         fixtures_dir = os.path.join(settings.PROJECT_DIR, "base", "fixtures")
@@ -28,7 +96,9 @@ class Command(BaseCommand):
 
         print("Copying media files to configured storage...")  # noqa: T201
         local_storage = FileSystemStorage(os.path.join(fixtures_dir, "media"))
-        self._copy_files(local_storage, "")  # file storage paths are relative
+        self._copy_files(
+            local_storage, workers=options["workers"], check_hash=options["check_hash"]
+        )
 
         # Wagtail creates default Site and Page instances during install, but we already have
         # them in the data load. Remove the auto-generated ones.
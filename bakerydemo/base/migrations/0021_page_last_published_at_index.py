@@ -0,0 +1,38 @@
+from django.db import migrations
+
+# Index for the pages API listings walked by cursor, newest first, see
+# CursorPagination in bakerydemo/api.py. Wagtail doesn't index
+# last_published_at, and the Page model can't be given an index from here.
+INDEX_NAME = "bakerydemo_page_last_published"
+
+
+def create_index(apps, schema_editor):
+    quote_name = schema_editor.quote_name
+    # NULLs sort first in descending PostgreSQL indexes unless told otherwise;
+    # the listings put them last
+    nulls = " NULLS LAST" if schema_editor.connection.vendor == "postgresql" else ""
+    schema_editor.execute(
+        f"CREATE INDEX {quote_name(INDEX_NAME)} ON {quote_name('wagtailcore_page')} "
+        f"({quote_name('last_published_at')} DESC{nulls}, {quote_name('id')} DESC)"
+    )
+
+
+def drop_index(apps, schema_editor):
+    schema_editor.execute(
+        schema_editor.sql_delete_index
+        % {
+            "name": schema_editor.quote_name(INDEX_NAME),
+            "table": schema_editor.quote_name("wagtailcore_page"),
+        }
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("base", "0020_alter_footertext_options"),
+        ("wagtailcore", "0083_workflowcontenttype"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
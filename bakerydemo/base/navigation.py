@@ -0,0 +1,149 @@
+from django.core.cache import cache
+from wagtail.models import Page, Site
+
+from bakerydemo.base.cache import bump_generation, get_generation
+
+# The main menu shows the site root's children and, in the drop downs, their
+# own children. Two levels are enough for the header templates.
+MENU_DEPTH = 2
+
+# The menu is invalidated by the signal handlers in base/signal_handlers.py;
+# the timeout is a safety net for per-process caches (e.g. the default
+# local-memory cache) that other workers can't invalidate.
+MENU_CACHE_TIMEOUT = 60 * 60
+MENU_CACHE_KEY = "bakerydemo:menu:{}:{}"
+
+BREADCRUMBS_CACHE_TIMEOUT = 60 * 60 * 24
+BREADCRUMBS_CACHE_KEY = "bakerydemo:breadcrumb:{}:{}:{}"
+
+
+def get_site_id(request):
+    """
+    Returns the id of the site of `request`, if any. The URLs of pages are
+    relative to the site of the request, and absolute for pages of other
+    sites, so cached URLs are only valid for the site they were built for.
+    """
+    site = Site.find_for_request(request) if request is not None else None
+    return site.pk if site is not None else None
+
+
+def build_menu_tree(root_page, request=None):
+    """
+    Returns the in-menu subtree below `root_page` as a list of plain dicts:
+
+        {"id", "title", "url", "url_path", "children": [...]}
+
+    The whole subtree is fetched in a single query using the treebeard `path`
+    range of the root page, instead of calling `get_children()` on every
+    menu item.
+    """
+    pages = (
+        Page.objects.filter(
+            path__startswith=root_page.path,
+            depth__gt=root_page.depth,
+            depth__lte=root_page.depth + MENU_DEPTH,
+        )
+        .live()
+        .in_menu()
+        .order_by("path")
+    )
+
+    root = {"children": []}
+    nodes = {root_page.path: root}
+    for page in pages:
+        # A page is only reachable from the menu if its parent is, so skip
+        # pages whose parent is hidden from the menu or not live.
+        parent = nodes.get(page.path[: -Page.steplen])
+        if parent is None:
+            continue
+        node = {
+            "id": page.pk,
+            "title": page.title,
+            "url": page.get_url(request),
+            "url_path": page.url_path,
+            "children": [],
+        }
+        parent["children"].append(node)
+        nodes[page.path] = node
+    return root["children"]
+
+
+def get_menu_tree(root_page, request=None):
+    """
+    Returns the cached menu tree for `root_page`, building it on a cache miss.
+    The tree is cached for each site, as its URLs depend on the site of the
+    request.
+    """
+    key = MENU_CACHE_KEY.format(root_page.pk, get_site_id(request))
+    menu = cache.get(key)
+    if menu is None:
+        menu = build_menu_tree(root_page, request)
+        cache.set(key, menu, MENU_CACHE_TIMEOUT)
+    return menu
+
+
+def invalidate_menu_trees():
+    # Any page can appear in the menu of any site, so drop the menus of all of
+    # the site roots, as seen from each site (or without a request), rather
+    # than trying to work out which one is affected.
+    sites = list(Site.objects.values_list("pk", "root_page_id"))
+    site_ids = [site_id for site_id, _ in sites] + [None]
+    cache.delete_many(
+        [
+            MENU_CACHE_KEY.format(root_page_id, site_id)
+            for _, root_page_id in sites
+            for site_id in site_ids
+        ]
+    )
+
+
+def get_ancestor_paths(page):
+    """
+    Returns the treebeard paths of the ancestors of `page` below the tree root,
+    `page` included. Each level of the tree adds `Page.steplen` characters to
+    the path, so the ancestors' paths are simply prefixes of the page's path.
+    """
+    return [
+        page.path[:end]
+        for end in range(Page.steplen * 2, len(page.path) + 1, Page.steplen)
+    ]
+
+
+def get_breadcrumbs(page, request=None):
+    """
+    Returns `(title, url)` pairs for the ancestors of `page`, `page` included,
+    from the homepage down.
+
+    Each ancestor is cached individually under its path (and the site of the
+    request, which its URL depends on), so pages sharing a branch of the tree
+    share the cache entries and deep pages render their breadcrumbs without
+    any query once the cache is warm.
+    """
+    paths = get_ancestor_paths(page)
+    generation = get_generation("breadcrumbs")
+    site_id = get_site_id(request)
+    keys = {
+        path: BREADCRUMBS_CACHE_KEY.format(generation, site_id, path) for path in paths
+    }
+    cached = cache.get_many(keys.values())
+    crumbs = {path: cached[key] for path, key in keys.items() if key in cached}
+
+    missing = [path for path in paths if path not in crumbs]
+    if missing:
+        fetched = {
+            ancestor.path: (ancestor.title, ancestor.get_url(request))
+            for ancestor in Page.objects.filter(path__in=missing)
+        }
+        cache.set_many(
+            {keys[path]: crumb for path, crumb in fetched.items()},
+            BREADCRUMBS_CACHE_TIMEOUT,
+        )
+        crumbs.update(fetched)
+
+    return [crumbs[path] for path in paths if path in crumbs]
+
+
+def invalidate_breadcrumbs():
+    # Moving or renaming a page changes the breadcrumbs of all its
+    # descendants, so start a new generation rather than hunting them down.
+    bump_generation("breadcrumbs")
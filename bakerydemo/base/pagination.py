@@ -0,0 +1,222 @@
+import base64
+import binascii
+import datetime
+import json
+import operator
+from functools import reduce
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+
+# The JSON types of the values encode_cursor() produces
+CURSOR_VALUE_TYPES = (str, int, float, bool, type(None))
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder rounds times to milliseconds, which would make the
+    # pages skip or repeat the rows within the same millisecond as the cursor
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def get_query_prefix(request, *exclude):
+    """
+    Returns the query string of the request without the `exclude` parameters,
+    ready to have another parameter appended ("a=1&b=2&", or ""), so that
+    pagination and filter links keep the other parameters.
+    """
+    params = request.GET.copy()
+    for name in exclude:
+        params.pop(name, None)
+    return f"{params.urlencode()}&" if params else ""
+
+
+class CursorPage:
+    """
+    A page of results returned by `KeysetPaginator`. It mimics the parts of
+    `django.core.paginator.Page` that make sense without page numbers.
+    """
+
+    def __init__(self, object_list, next_cursor, previous_cursor, count=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        # Approximate total number of objects, if the paginator was asked
+        # to count them
+        self.count = count
+
+    def __repr__(self):
+        return f"<CursorPage of {len(self.object_list)} objects>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+
+class KeysetPaginator:
+    """
+    Paginates a queryset by filtering on the values of its ordering fields
+    ("seek" pagination) instead of using OFFSET, so that every page costs the
+    same single query however deep it is, and no COUNT(*) is needed.
+
+    `ordering` must identify rows uniquely, e.g. `("-first_published_at",
+    "-id")`. Pages are identified by opaque cursors that encode the ordering
+    values of the row the page starts after (or ends before). The queryset
+    can also be a values() queryset that includes the ordering fields.
+    """
+
+    count_cache_timeout = 60 * 5
+
+    def __init__(self, queryset, per_page, ordering, count_cache_key=None):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        # Cache key under which to store an approximate count of the queryset,
+        # if one is wanted. The count is cached, so it can be off by the
+        # changes made since it was computed.
+        self.count_cache_key = count_cache_key
+
+    @property
+    def fields(self):
+        return [field.lstrip("-") for field in self.ordering]
+
+    def encode_cursor(self, obj, direction):
+        if isinstance(obj, dict):
+            values = [obj[field] for field in self.fields]
+        else:
+            values = [getattr(obj, field) for field in self.fields]
+        data = json.dumps([direction, values], cls=CursorEncoder)
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, cursor):
+        try:
+            data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            direction, values = json.loads(data)
+        except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+            raise InvalidCursor(cursor)
+        # Cursors come from the query string, so they can't be trusted to
+        # hold what encode_cursor() put in them
+        if (
+            direction not in ("next", "previous")
+            or not isinstance(values, list)
+            or len(values) != len(self.fields)
+            or not all(isinstance(value, CURSOR_VALUE_TYPES) for value in values)
+        ):
+            raise InvalidCursor(cursor)
+        try:
+            values = [
+                self._get_model_field(field).to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except (ValidationError, TypeError, ValueError, OverflowError):
+            raise InvalidCursor(cursor)
+        return direction, values
+
+    def _get_model_field(self, name):
+        return self.queryset.model._meta.get_field(name)
+
+    def _get_ordering(self, reverse):
+        # NULLs are sorted after the other values when moving forward (and so
+        # before them when moving backward), whatever the database default.
+        ordering = []
+        for field in self.ordering:
+            expression = F(field.lstrip("-"))
+            nulls = {"nulls_first": True} if reverse else {"nulls_last": True}
+            if field.startswith("-") != reverse:
+                ordering.append(expression.desc(**nulls))
+            else:
+                ordering.append(expression.asc(**nulls))
+        return ordering
+
+    def _seek_filter(self, values, reverse):
+        # For an ordering (a, b) the rows after (x, y) are:
+        # a > x OR (a = x AND b > y), with > meaning < for descending fields.
+        # Nullable fields also have to account for the NULLs sorted last.
+        conditions = []
+        for index, field in enumerate(self.ordering):
+            name = field.lstrip("-")
+            value = values[index]
+            nullable = self._get_model_field(name).null
+            descending = field.startswith("-") != reverse
+            lookup = "lt" if descending else "gt"
+
+            if value is None:
+                # Only non-NULL values come before NULLs, nothing comes after
+                if not reverse:
+                    continue
+                condition = Q(**{f"{name}__isnull": False})
+            else:
+                condition = Q(**{f"{name}__{lookup}": value})
+                if nullable and not reverse:
+                    condition |= Q(**{f"{name}__isnull": True})
+
+            for previous, previous_value in zip(self.fields[:index], values):
+                if previous_value is None:
+                    condition &= Q(**{f"{previous}__isnull": True})
+                else:
+                    condition &= Q(**{previous: previous_value})
+            conditions.append(condition)
+        return reduce(operator.or_, conditions)
+
+    def count(self):
+        if self.count_cache_key is None:
+            return None
+        return cache.get_or_set(
+            self.count_cache_key, self.queryset.count, self.count_cache_timeout
+        )
+
+    def page(self, cursor=None):
+        """
+        Returns the `CursorPage` for `cursor`, or the first page if no cursor
+        is given. Raises `InvalidCursor` if the cursor can't be decoded.
+        """
+        if cursor:
+            direction, values = self.decode_cursor(cursor)
+        else:
+            direction, values = "next", None
+
+        reverse = direction == "previous"
+        queryset = self.queryset.order_by(*self._get_ordering(reverse))
+        if values is not None:
+            queryset = queryset.filter(self._seek_filter(values, reverse))
+
+        # Fetch one more row than needed, to know if there are more pages in
+        # the direction we're moving in
+        objects = list(queryset[: self.per_page + 1])
+        has_more = len(objects) > self.per_page
+        objects = objects[: self.per_page]
+        if reverse:
+            objects.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+
+        next_cursor = previous_cursor = None
+        if objects and has_next:
+            next_cursor = self.encode_cursor(objects[-1], "next")
+        if objects and has_previous:
+            previous_cursor = self.encode_cursor(objects[0], "previous")
+
+        return CursorPage(objects, next_cursor, previous_cursor, count=self.count())
@@ -0,0 +1,36 @@
+from rest_framework.fields import Field
+
+
+class LiveRelationField(Field):
+    """
+    Serializes a to-many relation in the pages API, as the related or child
+    objects would be serialized by default, but leaving out those whose
+    `live_lookup` (e.g. "live", or "person__live" for the relationships of
+    a page to people) is false, so that the API doesn't show the draft and
+    unpublished snippets that the site hides.
+
+    The API prefetches the relation with the same filter when it can (see
+    get_relation_lookups() in bakerydemo/api.py); the objects are filtered
+    again here for the detail views, where it doesn't.
+    """
+
+    def __init__(self, live_lookup="live", **kwargs):
+        self.live_lookup = live_lookup
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def is_live(self, obj):
+        for name in self.live_lookup.split("__"):
+            obj = getattr(obj, name)
+        return bool(obj)
+
+    def to_representation(self, value):
+        # The serializer of the related objects is built by the API for the
+        # requested fields, e.g. ?fields=ingredients(name)
+        serializer_class = self.parent.child_serializer_classes[self.field_name]
+        serializer = serializer_class(context=self.context)
+        return [
+            serializer.to_representation(obj)
+            for obj in value.all()
+            if self.is_live(obj)
+        ]
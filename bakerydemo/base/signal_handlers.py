@@ -0,0 +1,75 @@
+from django.db.models.signals import post_delete, post_save
+from wagtail.documents import get_document_model
+from wagtail.images import get_image_model
+from wagtail.models import Page
+from wagtail.signals import (
+    page_published,
+    page_unpublished,
+    post_page_move,
+    published,
+    unpublished,
+)
+
+from bakerydemo.base.cache import bump_generation, invalidate_api_cache
+from bakerydemo.base.footer import invalidate_footer_html
+from bakerydemo.base.models import FooterText, Person
+from bakerydemo.base.navigation import invalidate_breadcrumbs, invalidate_menu_trees
+
+
+def invalidate_navigation(sender, **kwargs):
+    invalidate_menu_trees()
+    invalidate_breadcrumbs()
+
+
+def invalidate_footer_text(sender, **kwargs):
+    invalidate_footer_html()
+
+
+def invalidate_people(sender, **kwargs):
+    # Pages listing authors (e.g. the blog tag archives) include the
+    # generation in their ETags
+    bump_generation("people")
+
+
+def invalidate_api_pages(sender, **kwargs):
+    invalidate_api_cache("pages")
+
+
+def invalidate_api_deleted_page(sender, instance, **kwargs):
+    if isinstance(instance, Page):
+        invalidate_api_cache("pages")
+
+
+def invalidate_api_images(sender, **kwargs):
+    invalidate_api_cache("images")
+
+
+def invalidate_api_documents(sender, **kwargs):
+    invalidate_api_cache("documents")
+
+
+def register_signal_handlers():
+    page_published.connect(invalidate_navigation)
+    page_unpublished.connect(invalidate_navigation)
+    post_page_move.connect(invalidate_navigation)
+
+    published.connect(invalidate_footer_text, sender=FooterText)
+    unpublished.connect(invalidate_footer_text, sender=FooterText)
+    post_delete.connect(invalidate_footer_text, sender=FooterText)
+
+    post_save.connect(invalidate_people, sender=Person)
+    post_delete.connect(invalidate_people, sender=Person)
+
+    # The API only serves live pages, so drafts don't invalidate it
+    page_published.connect(invalidate_api_pages)
+    page_unpublished.connect(invalidate_api_pages)
+    post_page_move.connect(invalidate_api_pages)
+    post_delete.connect(invalidate_api_deleted_page)
+    # People are part of the blog posts in the API
+    post_save.connect(invalidate_api_pages, sender=Person)
+    post_delete.connect(invalidate_api_pages, sender=Person)
+
+    post_save.connect(invalidate_api_images, sender=get_image_model())
+    post_delete.connect(invalidate_api_images, sender=get_image_model())
+    post_save.connect(invalidate_api_documents, sender=get_document_model())
+    post_delete.connect(invalidate_api_documents, sender=get_document_model())
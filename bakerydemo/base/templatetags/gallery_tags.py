@@ -1,15 +1,66 @@
 from django import template
-from wagtail.images.models import Image
+from django.core.paginator import Paginator
+from wagtail.images.models import Filter, Image, Picture
 
 register = template.Library()
 
+# The renditions shown for each image of a gallery, as for the `{% picture %}`
+# tag: three formats of two sizes each.
+GALLERY_FILTER_SPEC = "format-{avif,webp,jpeg} fill-{300x200-c75,645x480-c75}"
+GALLERY_IMAGE_SIZES = "(max-width: 768px)150px,30vw"
+GALLERY_PAGE_SIZE = 24
+# How many images of a gallery page can have their missing renditions
+# generated while rendering it
+GALLERY_RENDITIONS_PER_REQUEST = 4
+
+
+def get_gallery_filters():
+    return [Filter(spec) for spec in Filter.expand_spec(GALLERY_FILTER_SPEC)]
+
+
+def get_gallery_picture(image, filters, generate=False):
+    """
+    Returns the `Picture` of `image` for `filters`. If some of its renditions
+    are missing, they are generated if `generate` is set, otherwise None is
+    returned.
+    """
+    renditions = image.find_existing_renditions(*filters)
+    if len(renditions) == len(filters):
+        renditions = {filter.spec: renditions[filter] for filter in filters}
+    elif generate:
+        renditions = image.get_renditions(*filters)
+    else:
+        return None
+    return Picture(renditions, {"sizes": GALLERY_IMAGE_SIZES, "loading": "lazy"})
+
 
 # Retrieves a single gallery item and returns a gallery of images
 @register.inclusion_tag("tags/gallery.html", takes_context=True)
-def gallery(context, gallery):
-    images = Image.objects.filter(collection=gallery)
+def gallery(context, gallery, page_size=GALLERY_PAGE_SIZE):
+    request = context["request"]
+    filters = get_gallery_filters()
+
+    # All the renditions of a page of images are fetched in a single query,
+    # rather than looked up one by one for each image and format
+    images = (
+        Image.objects.filter(collection=gallery)
+        .order_by("-created_at", "-pk")
+        .prefetch_renditions(*filters)
+    )
+    images = Paginator(images, page_size).get_page(request.GET.get("page"))
+
+    # The missing renditions of a few images are generated while rendering,
+    # so that a new gallery fills in over a few requests without any of them
+    # taking too long, and the other images are served on demand meanwhile.
+    # The generate_gallery_renditions command generates them all beforehand.
+    budget = GALLERY_RENDITIONS_PER_REQUEST
+    for image in images:
+        image.gallery_picture = get_gallery_picture(image, filters)
+        if image.gallery_picture is None and budget > 0:
+            image.gallery_picture = get_gallery_picture(image, filters, generate=True)
+            budget -= 1
 
     return {
         "images": images,
-        "request": context["request"],
+        "request": request,
     }
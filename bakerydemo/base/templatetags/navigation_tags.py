@@ -1,7 +1,9 @@
 from django import template
-from wagtail.models import Page, Site
+from wagtail.models import Site
+from wagtail.templatetags.wagtailcore_tags import richtext
 
-from bakerydemo.base.models import FooterText
+from bakerydemo.base.footer import get_footer_html
+from bakerydemo.base.navigation import get_breadcrumbs, get_menu_tree
 
 register = template.Library()
 # https://docs.djangoproject.com/en/3.2/howto/custom-template-tags/
@@ -15,13 +17,6 @@ def get_site_root(context):
     return Site.find_for_request(context["request"]).root_page
 
 
-def has_menu_children(page):
-    # This is used by the top_menu property
-    # get_children is a Treebeard API thing
-    # https://tabo.pe/projects/django-treebeard/docs/4.0.1/api.html
-    return page.get_children().live().in_menu().exists()
-
-
 def has_children(page):
     # Generically allow index pages to list their children
     return page.get_children().live().exists()
@@ -33,49 +28,53 @@ def is_active(page, current_page):
 
 
 # Retrieves the top menu items - the immediate children of the parent page
-# The has_menu_children method is necessary because the Foundation menu requires
-# a dropdown class to be applied to a parent
+# The show_dropdown flag is necessary because the Foundation menu requires
+# a dropdown class to be applied to a parent.
+# The menu items come from the cached menu tree built in base/navigation.py,
+# so rendering the menu doesn't hit the database once the cache is warm.
 @register.inclusion_tag("tags/top_menu.html", takes_context=True)
 def top_menu(context, parent, calling_page=None):
-    menuitems = parent.get_children().live().in_menu()
-    for menuitem in menuitems:
-        menuitem.show_dropdown = has_menu_children(menuitem)
-        # We don't directly check if calling_page is None since the template
-        # engine can pass an empty string to calling_page
-        # if the variable passed as calling_page does not exist.
-        menuitem.active = (
-            calling_page.url_path.startswith(menuitem.url_path)
-            if calling_page
-            else False
-        )
+    menuitems = [
+        {
+            **menuitem,
+            "show_dropdown": bool(menuitem["children"]),
+            # We don't directly check if calling_page is None since the
+            # template engine can pass an empty string to calling_page
+            # if the variable passed as calling_page does not exist.
+            "active": (
+                calling_page.url_path.startswith(menuitem["url_path"])
+                if calling_page
+                else False
+            ),
+        }
+        for menuitem in get_menu_tree(parent, context.get("request"))
+    ]
     return {
         "calling_page": calling_page,
         "menuitems": menuitems,
-        # required by the pageurl tag that we want to use within this template
         "request": context["request"],
     }
 
 
-# Retrieves the children of the top menu items for the drop downs
+# Retrieves the children of the top menu items for the drop downs. `parent` is
+# a menu item as returned by top_menu.
 @register.inclusion_tag("tags/top_menu_children.html", takes_context=True)
 def top_menu_children(context, parent, calling_page=None):
-    menuitems_children = parent.get_children()
-    menuitems_children = menuitems_children.live().in_menu()
-    for menuitem in menuitems_children:
-        menuitem.has_dropdown = has_menu_children(menuitem)
-        # We don't directly check if calling_page is None since the template
-        # engine can pass an empty string to calling_page
-        # if the variable passed as calling_page does not exist.
-        menuitem.active = (
-            calling_page.url_path.startswith(menuitem.url_path)
-            if calling_page
-            else False
-        )
-        menuitem.children = menuitem.get_children().live().in_menu()
+    menuitems_children = [
+        {
+            **menuitem,
+            "has_dropdown": bool(menuitem["children"]),
+            "active": (
+                calling_page.url_path.startswith(menuitem["url_path"])
+                if calling_page
+                else False
+            ),
+        }
+        for menuitem in parent["children"]
+    ]
     return {
         "parent": parent,
         "menuitems_children": menuitems_children,
-        # required by the pageurl tag that we want to use within this template
         "request": context["request"],
     }
 
@@ -87,7 +86,9 @@ def breadcrumbs(context):
         # When on the home page, displaying breadcrumbs is irrelevant.
         ancestors = ()
     else:
-        ancestors = Page.objects.ancestor_of(self, inclusive=True).filter(depth__gt=1)
+        # (title, url) pairs resolved from the cached breadcrumbs, see
+        # base/navigation.py
+        ancestors = get_breadcrumbs(self, context.get("request"))
     return {
         "ancestors": ancestors,
         "request": context["request"],
@@ -101,10 +102,12 @@ def get_footer_text(context):
     # or page types that need a custom footer
     footer_text = context.get("footer_text", "")
 
-    # If the context doesn't have footer_text defined, get one that's live
-    if not footer_text:
-        instance = FooterText.objects.filter(live=True).first()
-        footer_text = instance.body if instance else ""
+    if footer_text:
+        footer_text = richtext(footer_text)
+    else:
+        # Otherwise use the pre-rendered live footer text for the active
+        # language, see base/footer.py
+        footer_text = get_footer_html()
 
     return {
         "footer_text": footer_text,
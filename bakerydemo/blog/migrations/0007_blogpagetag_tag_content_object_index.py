@@ -0,0 +1,19 @@
+# Generated by Django 5.1.2 on 2026-10-17 22:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0006_rename_blogpeoplerelationship_person"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="blogpagetag",
+            index=models.Index(
+                fields=["tag", "content_object"], name="blog_blogpa_tag_id_2e41ba_idx"
+            ),
+        ),
+    ]
@@ -1,18 +1,38 @@
 from __future__ import unicode_literals
 
+from hashlib import md5
+
 from django.contrib import messages
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
 from django.db import models
+from django.db.models import Count, Max, Prefetch, Q
 from django.shortcuts import redirect, render
+from django.utils.cache import get_conditional_response
+from django.utils.functional import cached_property
+from django.utils.http import quote_etag
 from modelcluster.contrib.taggit import ClusterTaggableManager
 from modelcluster.fields import ParentalKey
 from taggit.models import Tag, TaggedItemBase
 from wagtail.admin.panels import FieldPanel, MultipleChooserPanel
+from wagtail.api import APIField
+from wagtail.api.v2.serializers import TagsField
 from wagtail.contrib.routable_page.models import RoutablePageMixin, route
 from wagtail.fields import StreamField
 from wagtail.models import Orderable, Page
 from wagtail.search import index
 
 from bakerydemo.base.blocks import BaseStreamBlock
+from bakerydemo.base.cache import bump_generation, get_generation
+from bakerydemo.base.pagination import InvalidCursor, KeysetPaginator
+from bakerydemo.base.serializers import LiveRelationField
+
+# The tags of the posts of each BlogIndexPage are invalidated by the signal
+# handlers in blog/signal_handlers.py; the timeout is a safety net for
+# per-process caches (e.g. the default local-memory cache) that other
+# workers can't invalidate.
+CHILD_TAGS_CACHE_TIMEOUT = 60 * 60
+CHILD_TAGS_CACHE_KEY = "bakerydemo:blog_tags:{}:{}"
 
 
 class BlogPersonRelationship(Orderable, models.Model):
@@ -31,6 +51,17 @@ class BlogPersonRelationship(Orderable, models.Model):
         "base.Person", related_name="person_blog_relationship", on_delete=models.CASCADE
     )
     panels = [FieldPanel("person")]
+    api_fields = [APIField("person")]
+
+
+class PrefetchedTagsField(TagsField):
+    """
+    Serializes tags like TagsField, but sorts them in Python so that the tags
+    prefetched by the pages API are used rather than queried for each post.
+    """
+
+    def to_representation(self, value):
+        return sorted(tag.name for tag in value.all())
 
 
 class BlogPageTag(TaggedItemBase):
@@ -44,6 +75,11 @@ class BlogPageTag(TaggedItemBase):
         "BlogPage", related_name="tagged_items", on_delete=models.CASCADE
     )
 
+    class Meta:
+        # Lets the posts of a tag be found from the index alone, see
+        # BlogIndexPage.get_posts()
+        indexes = [models.Index(fields=["tag", "content_object"])]
+
 
 class BlogPage(Page):
     """
@@ -91,6 +127,21 @@ class BlogPage(Page):
         index.SearchField("body"),
     ]
 
+    # Fields exposed in the pages API. The related objects are fetched along
+    # with the posts when they're requested, see bakerydemo/api.py
+    api_fields = [
+        APIField("subtitle"),
+        APIField("introduction"),
+        APIField("image"),
+        APIField("body"),
+        APIField("date_published"),
+        APIField(
+            "blog_person_relationship",
+            serializer=LiveRelationField(live_lookup="person__live"),
+        ),
+        APIField("tags", serializer=PrefetchedTagsField(read_only=True)),
+    ]
+
     def authors(self):
         """
         Returns the BlogPage's related people. Again note that we are using
@@ -99,27 +150,46 @@ class BlogPage(Page):
         with a loop on the template. If we tried to access the blog_person_
         relationship directly we'd print `blog.BlogPersonRelationship.None`
         """
-        # Only return authors that are not in draft
-        return [
-            n.person
-            for n in self.blog_person_relationship.filter(
+        # Use the relationships prefetched by get_listing_prefetches(), if any
+        relationships = getattr(self, "live_person_relationships", None)
+        if relationships is None:
+            # Only return authors that are not in draft
+            relationships = self.blog_person_relationship.filter(
                 person__live=True
             ).select_related("person")
-        ]
+        return [n.person for n in relationships]
 
-    @property
+    @cached_property
     def get_tags(self):
         """
         Similar to the authors function above we're returning all the tags that
         are related to the blog post into a list we can access on the template.
         We're additionally adding a URL to access BlogPage objects with that tag
         """
+        # Uses the tags prefetched by get_listing_prefetches(), if any
         tags = self.tags.all()
         base_url = self.get_parent().url
         for tag in tags:
             tag.url = f"{base_url}tags/{tag.slug}/"
         return tags
 
+    @staticmethod
+    def get_listing_prefetches():
+        """
+        Returns the prefetches that let a list of posts show their authors and
+        tags in a constant number of queries, rather than a few per post.
+        """
+        return [
+            Prefetch(
+                "blog_person_relationship",
+                queryset=BlogPersonRelationship.objects.filter(
+                    person__live=True
+                ).select_related("person", "person__image"),
+                to_attr="live_person_relationships",
+            ),
+            "tags",
+        ]
+
     # Specifies parent to BlogPage as being BlogIndexPages
     parent_page_types = ["BlogIndexPage"]
 
@@ -166,9 +236,7 @@ class BlogIndexPage(RoutablePageMixin, Page):
     # https://docs.wagtail.org/en/stable/getting_started/tutorial.html#overriding-context
     def get_context(self, request):
         context = super(BlogIndexPage, self).get_context(request)
-        context["posts"] = (
-            BlogPage.objects.descendant_of(self).live().order_by("-date_published")
-        )
+        context["posts"] = self.get_posts().order_by("-date_published")
         return context
 
     # This defines a Custom view that utilizes Tags. This view will return all
@@ -178,6 +246,12 @@ class BlogIndexPage(RoutablePageMixin, Page):
     @route(r"^tags/$", name="tag_archive")
     @route(r"^tags/([\w-]+)/$", name="tag_archive")
     def tag_archive(self, request, tag=None):
+        # The archive only changes when posts or tags do, so browsers can
+        # revalidate it without the posts being fetched again
+        etag = self.get_tag_archive_etag(request, tag)
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            return response
 
         try:
             tag = Tag.objects.get(slug=tag)
@@ -187,27 +261,117 @@ class BlogIndexPage(RoutablePageMixin, Page):
                 messages.add_message(request, messages.INFO, msg)
             return redirect(self.url)
 
-        posts = self.get_posts(tag=tag)
+        posts = self.paginate(request, tag)
         context = {"self": self, "tag": tag, "posts": posts}
-        return render(request, "blog/blog_index_page.html", context)
+        response = render(request, "blog/blog_index_page.html", context)
+        response["ETag"] = etag
+        return response
+
+    # The posts and tags are versioned from the posts themselves: publishing,
+    # unpublishing or moving a post under this page changes the number of
+    # posts or the latest publication date, as does tagging or untagging one
+    # (which requires publishing it). The rest of the rendered page is covered
+    # by the generations of the menu and breadcrumbs (bumped whenever a page
+    # is published, unpublished or moved), the footer text and the authors
+    # (see base/signal_handlers.py), which are only shared between processes
+    # when a shared cache is configured (see CACHES in settings/base.py). The
+    # user is included as the page shows the Wagtail user bar to editors.
+    def get_tag_archive_etag(self, request, tag):
+        posts = BlogPage.objects.live().descendant_of(self)
+        tagged = BlogPageTag.objects.filter(tag__slug=tag).values("content_object")
+        version = [
+            posts.aggregate(
+                count=Count("pk"),
+                tagged=Count("pk", filter=Q(pk__in=tagged)),
+                latest=Max("last_published_at"),
+            ),
+            get_generation("blog_tags"),
+            get_generation("breadcrumbs"),
+            get_generation("footer_text"),
+            get_generation("people"),
+            self.pk,
+            self.last_published_at,
+            tag,
+            request.user.pk,
+        ]
+        return quote_etag(md5(repr(version).encode()).hexdigest())
+
+    # Set to True to always use cursor pagination for the tag archives.
+    # Otherwise it is only used when the request has a `cursor` parameter.
+    cursor_pagination = False
+
+    # Paginates the posts with a tag, by page number or, as on the
+    # BreadsIndexPage, by cursor (see base/pagination.py) so that deep pages
+    # of large tags cost the same as the first one.
+    def paginate(self, request, tag):
+        posts = self.get_posts(tag=tag).order_by("-date_published", "-id")
+
+        if self.cursor_pagination or "cursor" in request.GET:
+            paginator = KeysetPaginator(
+                posts,
+                12,
+                ordering=("-date_published", "-id"),
+                count_cache_key=f"bakerydemo:blog_tag_count:{self.pk}:{tag.pk}",
+            )
+            try:
+                return paginator.page(request.GET.get("cursor"))
+            except InvalidCursor:
+                return paginator.page()
+
+        paginator = Paginator(posts, 12)
+        try:
+            return paginator.page(request.GET.get("page"))
+        except PageNotAnInteger:
+            return paginator.page(1)
+        except EmptyPage:
+            return paginator.page(paginator.num_pages)
 
     def serve_preview(self, request, mode_name):
         # Needed for previews to work
         return self.serve(request)
 
-    # Returns the child BlogPage objects for this BlogPageIndex.
+    # Returns the child BlogPage objects for this BlogPageIndex, ready to be
+    # listed with their image, authors and tags.
     # If a tag is used then it will filter the posts by tag.
     def get_posts(self, tag=None):
-        posts = BlogPage.objects.live().descendant_of(self)
+        posts = (
+            BlogPage.objects.live()
+            .descendant_of(self)
+            .select_related("image")
+            .prefetch_related(*BlogPage.get_listing_prefetches())
+        )
         if tag:
-            posts = posts.filter(tags=tag)
+            # A subquery on the tagged items alone, rather than a join, so
+            # that it's answered from the (tag, content_object) index
+            posts = posts.filter(
+                pk__in=BlogPageTag.objects.filter(tag=tag).values("content_object")
+            )
         return posts
 
-    # Returns the list of Tags for all child posts of this BlogPage.
+    # Returns the list of Tags for all child posts of this BlogPage, each
+    # annotated with the number of posts using it as `post_count`. The tags are
+    # counted in a single aggregate query, and cached.
     def get_child_tags(self):
-        tags = []
-        for post in self.get_posts():
-            # Not tags.append() because we don't want a list of lists
-            tags += post.get_tags
-        tags = sorted(set(tags))
+        key = CHILD_TAGS_CACHE_KEY.format(get_generation("blog_tags"), self.pk)
+        tags = cache.get(key)
+        if tags is None:
+            tags = list(
+                Tag.objects.filter(
+                    blog_blogpagetag_items__content_object__in=self.get_posts()
+                )
+                .annotate(post_count=Count("blog_blogpagetag_items"))
+                .order_by("name")
+            )
+            cache.set(key, tags, CHILD_TAGS_CACHE_TIMEOUT)
+
+        # The posts are children of this page, so the URL of their tags is
+        # based on this page's URL
+        base_url = self.url
+        for tag in tags:
+            tag.url = f"{base_url}tags/{tag.slug}/"
         return tags
+
+
+def invalidate_child_tags():
+    # A post can be moved between index pages, so drop the tags of all of them
+    bump_generation("blog_tags")
@@ -0,0 +1,21 @@
+from django.db.models.signals import post_delete, post_save
+from taggit.models import Tag
+from wagtail.signals import page_published, page_unpublished, post_page_move
+
+from bakerydemo.blog.models import BlogPage, invalidate_child_tags
+
+
+def invalidate_blog_tags(sender, **kwargs):
+    invalidate_child_tags()
+
+
+def register_signal_handlers():
+    page_published.connect(invalidate_blog_tags, sender=BlogPage)
+    page_unpublished.connect(invalidate_blog_tags, sender=BlogPage)
+    post_delete.connect(invalidate_blog_tags, sender=BlogPage)
+    post_page_move.connect(invalidate_blog_tags)
+
+    # Tags can be renamed or deleted from the admin without publishing the
+    # posts using them
+    post_save.connect(invalidate_blog_tags, sender=Tag)
+    post_delete.connect(invalidate_blog_tags, sender=Tag)
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class BreadsAppConfig(AppConfig):
+    name = "bakerydemo.breads"
+    label = "breads"
+
+    def ready(self):
+        from .signal_handlers import register_signal_handlers
+
+        register_signal_handlers()
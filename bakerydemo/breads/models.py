@@ -1,14 +1,37 @@
+from hashlib import md5
+
 from django import forms
 from django.contrib.contenttypes.fields import GenericRelation
+from django.core.cache import cache
 from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
 from django.db import models
+from django.db.models import Count, F, Prefetch
 from modelcluster.fields import ParentalManyToManyField
 from wagtail.admin.panels import FieldPanel, MultiFieldPanel
+from wagtail.api import APIField
 from wagtail.fields import StreamField
+from wagtail.images import get_image_model
 from wagtail.models import DraftStateMixin, Page, RevisionMixin
 from wagtail.search import index
 
 from bakerydemo.base.blocks import BaseStreamBlock
+from bakerydemo.base.cache import bump_generation, get_generation
+from bakerydemo.base.pagination import (
+    InvalidCursor,
+    KeysetPaginator,
+    get_query_prefix,
+)
+from bakerydemo.base.serializers import LiveRelationField
+
+BREAD_FACETS_CACHE_KEY = "bakerydemo:bread_facets:{}:{}:{}"
+BREAD_FACETS_CACHE_TIMEOUT = 60 * 60
+
+# The query parameters the breads can be filtered by, with their labels
+BREAD_FACETS = [
+    ("origin", "Origin"),
+    ("type", "Type"),
+    ("ingredient", "Ingredients"),
+]
 
 
 class Country(models.Model):
@@ -24,6 +47,8 @@ class Country(models.Model):
 
     title = models.CharField(max_length=100)
 
+    api_fields = [APIField("title")]
+
     def __str__(self):
         return self.title
 
@@ -56,6 +81,8 @@ class BreadIngredient(DraftStateMixin, RevisionMixin, models.Model):
         FieldPanel("name"),
     ]
 
+    api_fields = [APIField("name")]
+
     def __str__(self):
         return self.name
 
@@ -89,6 +116,8 @@ class BreadType(RevisionMixin, models.Model):
         FieldPanel("title"),
     ]
 
+    api_fields = [APIField("title")]
+
     def __str__(self):
         return self.title
 
@@ -157,6 +186,17 @@ class BreadPage(Page):
         index.SearchField("body"),
     ]
 
+    # Fields exposed in the pages API. The related objects are fetched along
+    # with the breads when they're requested, see bakerydemo/api.py
+    api_fields = [
+        APIField("introduction"),
+        APIField("image"),
+        APIField("body"),
+        APIField("origin"),
+        APIField("bread_type"),
+        APIField("ingredients", serializer=LiveRelationField()),
+    ]
+
     parent_page_types = ["BreadsIndexPage"]
 
 
@@ -188,11 +228,83 @@ class BreadsIndexPage(Page):
     subpage_types = ["BreadPage"]
 
     # Returns a queryset of BreadPage objects that are live, that are direct
-    # descendants of this index page with most recent first
-    def get_breads(self):
-        return (
-            BreadPage.objects.live().descendant_of(self).order_by("-first_published_at")
+    # descendants of this index page with most recent first, optionally only
+    # those matching the selected facets (see get_selected_facets), with what
+    # their listing cards show fetched up front. The id
+    # breaks ties between breads published at the same time, so that the
+    # order is stable across pages.
+    def get_breads(self, selected=None):
+        breads = (
+            BreadPage.objects.live()
+            .descendant_of(self)
+            .select_related("origin", "bread_type")
+            .prefetch_related(
+                Prefetch(
+                    "image", queryset=get_image_model().objects.prefetch_renditions()
+                )
+            )
+        )
+        if selected:
+            breads = filter_breads(breads, selected)
+        return breads.order_by("-first_published_at", "-id")
+
+    # Returns the facet values selected by the query parameters of the
+    # request, as sorted lists of ids, e.g. ?origin=1&ingredient=3&ingredient=5
+    # gives {"origin": [1], "type": [], "ingredient": [3, 5]}. Values that
+    # aren't ids are ignored.
+    def get_selected_facets(self, request):
+        return {
+            name: sorted(
+                {int(value) for value in request.GET.getlist(name) if value.isdigit()}
+            )
+            for name, _ in BREAD_FACETS
+        }
+
+    # Returns the values of each facet with the number of live breads under
+    # this index that would be listed when selecting them, as
+    # {"origin": [{"value", "name", "count"}, ...], ...}. The counts take
+    # the selections in the other facets into account. That's one grouped
+    # query per facet, cached until a bread or facet value changes (see
+    # breads/signal_handlers.py).
+    def get_facets(self, selected):
+        selection = ";".join(
+            f"{name}={','.join(map(str, selected[name]))}" for name, _ in BREAD_FACETS
         )
+        key = BREAD_FACETS_CACHE_KEY.format(
+            get_generation("breads"), self.pk, selection
+        )
+        facets = cache.get(key)
+        if facets is None:
+            breads = BreadPage.objects.live().descendant_of(self)
+            facets = {
+                "origin": list(
+                    filter_breads(breads, selected, exclude="origin")
+                    .filter(origin__isnull=False)
+                    .values(value=F("origin"), name=F("origin__title"))
+                    .annotate(count=Count("pk"))
+                    .order_by("name")
+                ),
+                "type": list(
+                    filter_breads(breads, selected, exclude="type")
+                    .filter(bread_type__isnull=False)
+                    .values(value=F("bread_type"), name=F("bread_type__title"))
+                    .annotate(count=Count("pk"))
+                    .order_by("name")
+                ),
+                # Ingredients are combined with AND, so these counts are
+                # within the breads matching all of the selections
+                "ingredient": list(
+                    BreadPage.ingredients.through.objects.filter(
+                        breadpage__in=filter_breads(breads, selected),
+                        breadingredient__live=True,
+                    )
+                    .values(value=F("breadingredient"), name=F("breadingredient__name"))
+                    .annotate(count=Count("breadpage"))
+                    .order_by("name")
+                ),
+            }
+            cache.set(key, facets, BREAD_FACETS_CACHE_TIMEOUT)
+        return facets
 
     # Allows child objects (e.g. BreadPage objects) to be accessible via the
     # template. We use this on the HomePage to display child items of featured
@@ -200,12 +312,19 @@ class BreadsIndexPage(Page):
     def children(self):
         return self.get_children().specific().live()
 
+    # Set to True to always use cursor pagination. Otherwise it is only used
+    # when the request has a `cursor` parameter.
+    cursor_pagination = False
+
     # Pagination for the index page. We use the `django.core.paginator` as any
     # standard Django app would, but the difference here being we have it as a
     # method on the model rather than within a view function
-    def paginate(self, request, *args):
+    def paginate(self, request, breads):
+        if self.cursor_pagination or "cursor" in request.GET:
+            return self.paginate_by_cursor(request, breads)
+
         page = request.GET.get("page")
-        paginator = Paginator(self.get_breads(), 12)
+        paginator = Paginator(breads, 12)
         try:
             pages = paginator.page(page)
         except PageNotAnInteger:
@@ -214,14 +333,91 @@ class BreadsIndexPage(Page):
             pages = paginator.page(paginator.num_pages)
         return pages
 
+    # Keyset pagination, see base/pagination.py. Rather than counting the
+    # breads and skipping the previous pages with OFFSET, each page is
+    # fetched from the position of the first or last bread of the page the
+    # visitor comes from, so deep pages cost the same as the first one.
+    # The total count is an approximation cached for a few minutes.
+    def paginate_by_cursor(self, request, breads):
+        paginator = KeysetPaginator(
+            breads,
+            12,
+            ordering=("-first_published_at", "-id"),
+            # One count per combination of facets. The query string is
+            # hashed as it can be of any length and contain anything.
+            count_cache_key="bakerydemo:breads_count:{}:{}".format(
+                self.pk,
+                md5(get_query_prefix(request, "page", "cursor").encode()).hexdigest(),
+            ),
+        )
+        try:
+            return paginator.page(request.GET.get("cursor"))
+        except InvalidCursor:
+            return paginator.page()
+
     # Returns the above to the get_context method that is used to populate the
     # template
     def get_context(self, request):
         context = super(BreadsIndexPage, self).get_context(request)
 
-        # BreadPage objects (get_breads) are passed through pagination
-        breads = self.paginate(request, self.get_breads())
+        # BreadPage objects (get_breads) matching the selected facets are
+        # passed through pagination
+        selected = self.get_selected_facets(request)
+        breads = self.paginate(request, self.get_breads(selected))
 
         context["breads"] = breads
+        context["facets_selected"] = any(selected.values())
+        context["facets"] = get_facet_links(
+            request, selected, self.get_facets(selected)
+        )
+        context["pagination_query"] = get_query_prefix(request, "page", "cursor")
 
         return context
+
+
+def filter_breads(breads, selected, exclude=None):
+    """
+    Filters the breads by the selected facet values (see
+    `BreadsIndexPage.get_selected_facets`), skipping the `exclude` facet.
+    Breads match any of the selected origins and types, and all of the
+    selected ingredients.
+    """
+    if selected["origin"] and exclude != "origin":
+        breads = breads.filter(origin__in=selected["origin"])
+    if selected["type"] and exclude != "type":
+        breads = breads.filter(bread_type__in=selected["type"])
+    if exclude != "ingredient":
+        for ingredient in selected["ingredient"]:
+            breads = breads.filter(
+                pk__in=BreadPage.ingredients.through.objects.filter(
+                    breadingredient=ingredient
+                ).values("breadpage")
+            )
+    return breads
+
+
+def get_facet_links(request, selected, facets):
+    # Returns the facets for the template, as (label, values) pairs, with the
+    # query string that toggles each value and whether it is selected
+    links = []
+    for name, label in BREAD_FACETS:
+        values = []
+        for value in facets[name]:
+            params = request.GET.copy()
+            params.pop("page", None)
+            params.pop("cursor", None)
+            is_selected = value["value"] in selected[name]
+            ids = [pk for pk in selected[name] if pk != value["value"]]
+            if not is_selected:
+                ids.append(value["value"])
+            params.setlist(name, [str(pk) for pk in sorted(ids)])
+            values.append(dict(value, selected=is_selected, query=params.urlencode()))
+        if values:
+            links.append((label, values))
+    return links
+
+
+def invalidate_bread_facets():
+    # Breads can be moved between index pages, so drop the facets of all of
+    # them
+    bump_generation("breads")
@@ -0,0 +1,35 @@
+from django.db.models.signals import post_delete, post_save
+from wagtail.signals import page_published, page_unpublished, post_page_move
+
+from bakerydemo.base.cache import invalidate_api_cache
+from bakerydemo.breads.models import (
+    BreadIngredient,
+    BreadPage,
+    BreadType,
+    Country,
+    invalidate_bread_facets,
+)
+
+
+def invalidate_facets(sender, **kwargs):
+    invalidate_bread_facets()
+
+
+def invalidate_api_pages(sender, **kwargs):
+    invalidate_api_cache("pages")
+
+
+def register_signal_handlers():
+    page_published.connect(invalidate_facets, sender=BreadPage)
+    page_unpublished.connect(invalidate_facets, sender=BreadPage)
+    post_delete.connect(invalidate_facets, sender=BreadPage)
+    post_page_move.connect(invalidate_facets)
+
+    # The facet values can be renamed, deleted or (for ingredients)
+    # unpublished from the admin without publishing the breads using them
+    for model in [Country, BreadType, BreadIngredient]:
+        post_save.connect(invalidate_facets, sender=model)
+        post_delete.connect(invalidate_facets, sender=model)
+        # They are also part of the bread pages in the API
+        post_save.connect(invalidate_api_pages, sender=model)
+        post_delete.connect(invalidate_api_pages, sender=model)
@@ -0,0 +1,104 @@
+import heapq
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def parse_lat_long(value):
+    """
+    Parses a "lat, long" string, as entered in `LocationPage.lat_long`, into a
+    `(latitude, longitude)` pair of floats. Raises ValueError if it isn't one.
+    """
+    latitude, longitude = (float(part) for part in value.split(","))
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError(f"Coordinates out of range: {value!r}")
+    return latitude, longitude
+
+
+def to_xyz(latitude, longitude):
+    # Points on the unit sphere: the straight-line (chord) distance between
+    # them grows with the distance along the surface, with no special cases
+    # for the poles or the antimeridian.
+    phi, lam = math.radians(latitude), math.radians(longitude)
+    return (
+        math.cos(phi) * math.cos(lam),
+        math.cos(phi) * math.sin(lam),
+        math.sin(phi),
+    )
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(chord / 2, 1))
+
+
+def km_to_chord(km):
+    return 2 * math.sin(min(km / (2 * EARTH_RADIUS_KM), math.pi / 2))
+
+
+class PointIndex:
+    """
+    A k-d tree over `(latitude, longitude, key)` points, answering nearest
+    neighbour and radius queries in logarithmic time on average.
+    """
+
+    def __init__(self, points):
+        self.size = len(points)
+        self.root = self._build(
+            [(to_xyz(latitude, longitude), key) for latitude, longitude, key in points],
+            0,
+        )
+
+    def _build(self, points, axis):
+        if not points:
+            return None
+        points.sort(key=lambda point: point[0][axis])
+        middle = len(points) // 2
+        next_axis = (axis + 1) % 3
+        xyz, key = points[middle]
+        return (
+            xyz,
+            key,
+            axis,
+            self._build(points[:middle], next_axis),
+            self._build(points[middle + 1 :], next_axis),
+        )
+
+    def nearest(self, latitude, longitude, count=None, radius_km=None):
+        """
+        Returns `(key, distance_km)` pairs for the `count` points nearest to
+        the given coordinates (all of them by default) within `radius_km` (if
+        given), closest first.
+        """
+        target = to_xyz(latitude, longitude)
+        limit = math.inf if radius_km is None else km_to_chord(radius_km) ** 2
+        # Max-heap (by negated squared chord length) of the best points so far
+        found = []
+
+        def bound():
+            if count is not None and len(found) >= count:
+                return min(limit, -found[0][0])
+            return limit
+
+        def search(node):
+            if node is None:
+                return
+            xyz, key, axis, left, right = node
+            distance = sum((a - b) ** 2 for a, b in zip(xyz, target))
+            if distance <= bound():
+                heapq.heappush(found, (-distance, key))
+                if count is not None and len(found) > count:
+                    heapq.heappop(found)
+            difference = target[axis] - xyz[axis]
+            near, far = (left, right) if difference < 0 else (right, left)
+            search(near)
+            # The other side can only hold closer points if the splitting
+            # plane is closer than the current bound
+            if difference**2 <= bound():
+                search(far)
+
+        if count != 0:
+            search(self.root)
+        return [
+            (key, chord_to_km(math.sqrt(-distance)))
+            for distance, key in sorted(found, reverse=True)
+        ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.1.2 on 2026-10-17 22:45
+
+from django.db import migrations, models
+
+# A frozen copy of bakerydemo.locations.schedule.build_schedule() as of this
+# migration, so that later changes to it don't change what the migration does
+DAYS = ["MON", "TUE", "WED", "THU", "FRI", "SAT", "SUN"]
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+def _minutes(time):
+    return time.hour * 60 + time.minute
+
+
+def build_schedule(hours):
+    intervals = []
+    for slot in hours:
+        if slot.closed or not slot.opening_time or not slot.closing_time:
+            continue
+        day_start = DAYS.index(slot.day) * MINUTES_PER_DAY
+        start = day_start + _minutes(slot.opening_time)
+        end = day_start + _minutes(slot.closing_time)
+        if end <= start:
+            end += MINUTES_PER_DAY
+        if end > MINUTES_PER_WEEK:
+            intervals.append([0, end - MINUTES_PER_WEEK])
+            end = MINUTES_PER_WEEK
+        intervals.append([start, end])
+
+    schedule = []
+    for start, end in sorted(intervals):
+        if schedule and start <= schedule[-1][1]:
+            schedule[-1][1] = max(schedule[-1][1], end)
+        else:
+            schedule.append([start, end])
+    return schedule
+
+
+def forwards_func(apps, schema_editor):
+    LocationPage = apps.get_model("locations", "locationpage")
+    db_alias = schema_editor.connection.alias
+    for location in LocationPage.objects.using(db_alias).prefetch_related(
+        "hours_of_operation"
+    ):
+        location.opening_schedule = build_schedule(location.hours_of_operation.all())
+        location.save(update_fields=["opening_schedule"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("locations", "0006_alter_locationoperatinghours_day"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="locationpage",
+            name="opening_schedule",
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.RunPython(forwards_func, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.2 on 2026-10-17 22:47
+
+from django.db import migrations, models
+
+
+# A frozen copy of bakerydemo.locations.geo.parse_lat_long() as of this
+# migration, so that later changes to it don't change what the migration does
+def parse_lat_long(value):
+    latitude, longitude = (float(part) for part in value.split(","))
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError(f"Coordinates out of range: {value!r}")
+    return latitude, longitude
+
+
+def forwards_func(apps, schema_editor):
+    LocationPage = apps.get_model("locations", "locationpage")
+    db_alias = schema_editor.connection.alias
+    for location in LocationPage.objects.using(db_alias).all():
+        try:
+            location.latitude, location.longitude = parse_lat_long(location.lat_long)
+        except ValueError:
+            continue
+        location.save(update_fields=["latitude", "longitude"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("locations", "0007_locationpage_opening_schedule"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="locationpage",
+            name="latitude",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="locationpage",
+            name="longitude",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(forwards_func, migrations.RunPython.noop),
+    ]
@@ -1,16 +1,25 @@
-from datetime import datetime
+from zoneinfo import ZoneInfo
 
 from django.conf import settings
 from django.core.validators import RegexValidator
 from django.db import models
+from django.db.models import Count, Max, Prefetch
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
 from modelcluster.fields import ParentalKey
 from wagtail.admin.panels import FieldPanel, InlinePanel
+from wagtail.api import APIField
 from wagtail.fields import StreamField
+from wagtail.images import get_image_model
 from wagtail.models import Orderable, Page
 from wagtail.search import index
 
 from bakerydemo.base.blocks import BaseStreamBlock
+from bakerydemo.base.pagination import get_query_prefix
 from bakerydemo.locations.choices import DAY_CHOICES
+from bakerydemo.locations.geo import PointIndex, parse_lat_long
+from bakerydemo.locations.schedule import build_schedule, is_open_at, minute_of_week
 
 
 class OperatingHours(models.Model):
@@ -32,6 +41,13 @@ class OperatingHours(models.Model):
         FieldPanel("closed"),
     ]
 
+    api_fields = [
+        APIField("day"),
+        APIField("opening_time"),
+        APIField("closing_time"),
+        APIField("closed"),
+    ]
+
     class Meta:
         abstract = True
 
@@ -86,14 +102,77 @@ class LocationsIndexPage(Page):
     def children(self):
         return self.get_children().specific().live()
 
+    # Returns the live locations below this page, with their images and the
+    # renditions of the images, so that listing them costs a fixed number of
+    # queries
+    def get_locations(self):
+        return (
+            LocationPage.objects.descendant_of(self)
+            .live()
+            .order_by("title")
+            .prefetch_related(
+                Prefetch(
+                    "image", queryset=get_image_model().objects.prefetch_renditions()
+                )
+            )
+        )
+
+    # Returns the live locations below this page nearest to the given
+    # coordinates, closest first, each with its `distance` in kilometres.
+    # Uses an in-memory index of the locations, see get_location_index().
+    def nearest_locations(self, latitude, longitude, count=5, radius_km=None):
+        nearest = get_location_index(self).nearest(
+            latitude, longitude, count=count, radius_km=radius_km
+        )
+        locations = self.get_locations().in_bulk([pk for pk, _ in nearest])
+        results = []
+        for pk, distance in nearest:
+            if pk in locations:
+                location = locations[pk]
+                location.distance = distance
+                results.append(location)
+        return results
+
+    # Returns the time given by the `open` parameter of the request: "now", or
+    # a date and time such as 2024-05-01T09:30 (in the time zone of the hours
+    # of operation, unless it includes an offset). None if there is none.
+    def get_open_at(self, request):
+        value = request.GET.get("open", "")
+        if value == "now":
+            return timezone.now()
+        try:
+            at = parse_datetime(value)
+        except ValueError:
+            return None
+        if at is not None and timezone.is_naive(at):
+            at = timezone.make_aware(at, ZoneInfo(settings.TIME_ZONE))
+        return at
+
     # Overrides the context to list all child
-    # items, that are live, by the title alphabetical order.
+    # items, that are live, by the title alphabetical order, or by distance
+    # when the request has a `near` parameter (e.g. ?near=64.14,-21.94).
+    # Each location is flagged with `open_now`, from its precomputed opening
+    # schedule, and the list is restricted to the open ones when the request
+    # has an `open` parameter (e.g. ?open=now).
     # https://docs.wagtail.org/en/stable/getting_started/tutorial.html#overriding-context
     def get_context(self, request):
         context = super(LocationsIndexPage, self).get_context(request)
-        context["locations"] = (
-            LocationPage.objects.descendant_of(self).live().order_by("title")
-        )
+        try:
+            near = parse_lat_long(request.GET.get("near", ""))
+        except ValueError:
+            locations = self.get_locations()
+        else:
+            locations = self.nearest_locations(*near, count=None)
+
+        open_at = self.get_open_at(request)
+        locations = LocationPage.annotate_open(locations, open_at)
+        if open_at is not None:
+            locations = [location for location in locations if location.open_now]
+
+        context["locations"] = locations
+        context["open_at"] = open_at
+        # Keep the other parameters (e.g. `near`) in the open filter links
+        context["open_query"] = get_query_prefix(request, "open")
         return context
 
     content_panels = Page.content_panels + [
@@ -132,6 +211,12 @@ class LocationPage(Page):
             ),
         ],
     )
+    # Parsed from lat_long when the page is saved, to be queried by distance
+    latitude = models.FloatField(null=True, blank=True, editable=False)
+    longitude = models.FloatField(null=True, blank=True, editable=False)
+    # The hours of operation as a weekly schedule (see locations/schedule.py),
+    # computed when the page is saved so that annotate_open() needs no query
+    opening_schedule = models.JSONField(default=list, blank=True, editable=False)
 
     # Search index configuration
     search_fields = Page.search_fields + [
@@ -139,6 +224,19 @@ class LocationPage(Page):
         index.SearchField("body"),
     ]
 
+    # Fields exposed in the pages API. The related objects are fetched along
+    # with the locations when they're requested, see bakerydemo/api.py
+    api_fields = [
+        APIField("introduction"),
+        APIField("image"),
+        APIField("body"),
+        APIField("address"),
+        APIField("lat_long"),
+        APIField("latitude"),
+        APIField("longitude"),
+        APIField("hours_of_operation"),
+    ]
+
     # Fields to show to the editor in the admin view
     content_panels = [
         FieldPanel("title"),
@@ -153,34 +251,91 @@ class LocationPage(Page):
     def __str__(self):
         return self.title
 
-    @property
+    # Cached, as the page template both tests and lists the hours, and
+    # is_open() builds the schedule from them
+    @cached_property
     def operating_hours(self):
         hours = self.hours_of_operation.all()
         return hours
 
-    # Determines if the location is currently open. It is timezone naive
-    def is_open(self):
-        now = datetime.now()
-        current_time = now.time()
-        current_day = now.strftime("%a").upper()
+    def save(self, *args, **kwargs):
         try:
-            self.operating_hours.get(
-                day=current_day,
-                opening_time__lte=current_time,
-                closing_time__gte=current_time,
-            )
-            return True
-        except LocationOperatingHours.DoesNotExist:
-            return False
+            self.latitude, self.longitude = parse_lat_long(self.lat_long)
+        except ValueError:
+            self.latitude = self.longitude = None
+        # The hours are the in-memory ones of the form or revision being saved
+        self.opening_schedule = build_schedule(self.hours_of_operation.all())
+        super().save(*args, **kwargs)
+
+    # Returns the (latitude, longitude) of lat_long. The stored fields are
+    # only updated when the page is saved, so previews and edited drafts
+    # can be ahead of them; they're only used if lat_long can't be parsed.
+    def get_coordinates(self):
+        try:
+            return parse_lat_long(self.lat_long)
+        except ValueError:
+            return self.latitude, self.longitude
+
+    # Returns the weekly schedule of the hours of operation. As with the
+    # coordinates, the stored opening_schedule is only updated when the page
+    # is saved, so it's built from the hours of the page being rendered,
+    # which are the in-memory ones for previews and edited drafts.
+    def get_opening_schedule(self):
+        return build_schedule(self.operating_hours)
+
+    # Determines if the location is open at the given time (default: now), in
+    # the time zone the hours of operation are entered in
+    def is_open(self, at=None):
+        return is_open_at(self.get_opening_schedule(), minute_of_week(at))
+
+    # Sets `open_now` on each of the locations, to whether it is open at the
+    # given time (default: now), without any query. Returns them as a list.
+    @staticmethod
+    def annotate_open(locations, at=None):
+        minute = minute_of_week(at)
+        locations = list(locations)
+        for location in locations:
+            location.open_now = is_open_at(location.opening_schedule, minute)
+        return locations
 
     # Makes additional context available to the template so that we can access
     # the latitude, longitude and map API key to render the map
     def get_context(self, request):
         context = super(LocationPage, self).get_context(request)
-        context["lat"] = self.lat_long.split(",")[0]
-        context["long"] = self.lat_long.split(",")[1]
+        context["lat"], context["long"] = self.get_coordinates()
         context["google_map_api_key"] = settings.GOOGLE_MAP_API_KEY
         return context
 
     # Can only be placed under a LocationsIndexPage object
     parent_page_types = ["LocationsIndexPage"]
+
+
+# The location indexes built by get_location_index(), by root page path, with
+# the version of the locations they were built for
+_location_indexes = {}
+
+
+def get_location_index(root_page=None):
+    """
+    Returns a `PointIndex` of the live locations below `root_page` (or all of
+    them), keyed by page id.
+
+    The index is built once per process and rebuilt when the locations change,
+    which is checked on each call with a single aggregate query: publishing a
+    location (e.g. with new coordinates) changes the latest publication date,
+    and unpublishing, deleting or moving one the number of live locations.
+    The check doesn't rely on the cache, so every process sees the changes.
+    """
+    path = root_page.path if root_page else ""
+    locations = LocationPage.objects.live().filter(
+        path__startswith=path, latitude__isnull=False
+    )
+    version = locations.aggregate(count=Count("pk"), latest=Max("last_published_at"))
+    cached = _location_indexes.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    points = locations.values_list("latitude", "longitude", "pk")
+    index = PointIndex(list(points))
+    _location_indexes[path] = (version, index)
+    return index
@@ -0,0 +1,66 @@
+from bisect import bisect_right
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.utils import timezone
+
+from bakerydemo.locations.choices import DAY_CHOICES
+
+# Weekly schedules are lists of [start, end) intervals in minutes since
+# Monday 00:00, sorted and without overlaps, e.g. Monday 09:00 - 17:00 is
+# [540, 1020].
+DAYS = [day for day, _ in DAY_CHOICES]
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+def _minutes(time):
+    return time.hour * 60 + time.minute
+
+
+def build_schedule(hours):
+    """
+    Returns the weekly schedule of the given operating hours (objects with
+    `day`, `opening_time`, `closing_time` and `closed` attributes).
+
+    Hours closing at or before their opening time run past midnight into the
+    next day, and Sunday night runs into Monday morning.
+    """
+    intervals = []
+    for slot in hours:
+        if slot.closed or not slot.opening_time or not slot.closing_time:
+            continue
+        day_start = DAYS.index(slot.day) * MINUTES_PER_DAY
+        start = day_start + _minutes(slot.opening_time)
+        end = day_start + _minutes(slot.closing_time)
+        if end <= start:
+            end += MINUTES_PER_DAY
+        if end > MINUTES_PER_WEEK:
+            intervals.append([0, end - MINUTES_PER_WEEK])
+            end = MINUTES_PER_WEEK
+        intervals.append([start, end])
+
+    # Merge overlapping and adjacent slots
+    schedule = []
+    for start, end in sorted(intervals):
+        if schedule and start <= schedule[-1][1]:
+            schedule[-1][1] = max(schedule[-1][1], end)
+        else:
+            schedule.append([start, end])
+    return schedule
+
+
+def minute_of_week(at=None):
+    """
+    Returns the minute of the week of `at` (default: now), in the time zone the
+    operating hours are entered in.
+    """
+    local = timezone.localtime(at, ZoneInfo(settings.TIME_ZONE))
+    return local.weekday() * MINUTES_PER_DAY + _minutes(local)
+
+
+def is_open_at(schedule, minute):
+    # The interval starting at or before `minute`, if any, is the only one
+    # that can contain it
+    index = bisect_right(schedule, [minute, MINUTES_PER_WEEK])
+    return index > 0 and minute < schedule[index - 1][1]
@@ -0,0 +1,78 @@
+import re
+from html import unescape
+
+from django.utils.html import strip_tags
+
+# Words of an ingredients list item that say how much of the ingredient to
+# use, rather than what it is
+UNITS = {
+    "cake", "cakes", "clove", "cloves", "cup", "cups", "g", "gram", "grams",
+    "kg", "l", "large", "lb", "lbs", "medium", "ml", "ounce", "ounces", "oz",
+    "pinch", "pound", "pounds", "small", "tablespoon", "tablespoons", "tbsp",
+    "teaspoon", "teaspoons", "tsp",
+}  # fmt: skip
+QUANTITY_RE = re.compile(r"^[\d¼½¾⅓⅔⅛.,/\s–-]+$")
+PARENTHESES_RE = re.compile(r"\([^)]*\)")
+
+
+def get_item_text(html):
+    """
+    Returns the plain text of a rich text ingredients list item.
+    """
+    return " ".join(unescape(strip_tags(html)).split())
+
+
+def normalise_ingredient(text):
+    """
+    Returns the name of the ingredient of an ingredients list item, in lower
+    case and without the quantity, e.g. "3 cups (720 mL) all-purpose flour"
+    gives "all-purpose flour". Notes after a comma ("2 lbs green apples,
+    peeled") are dropped.
+    """
+    text = PARENTHESES_RE.sub(" ", text.lower()).split(",")[0]
+    words = text.split()
+    while words and (QUANTITY_RE.match(words[0]) or words[0] in UNITS):
+        words.pop(0)
+    return " ".join(words)
+
+
+def iter_ingredients_html(stream_data):
+    """
+    Yields the rich text of the items of the `ingredients_list` blocks of the
+    raw data of a `RecipeStreamBlock` StreamField.
+    """
+    for block in stream_data:
+        if block["type"] != "ingredients_list":
+            continue
+        for item in block["value"]:
+            # ListBlock items are stored as {"type": "item", "value": ...}
+            # dicts, or as plain values in data saved by older Wagtail versions
+            yield item["value"] if isinstance(item, dict) else item
+
+
+def extract_ingredients(stream_data):
+    """
+    Returns `(name, text)` pairs for the ingredients listed in the raw data of
+    a `RecipeStreamBlock` StreamField, in order, with their normalised name
+    and their plain text.
+    """
+    ingredients = []
+    for html in iter_ingredients_html(stream_data):
+        text = get_item_text(html)
+        name = normalise_ingredient(text)
+        if name:
+            ingredients.append((name, text))
+    return ingredients
+
+
+def match_bread_ingredient(name, bread_ingredients):
+    """
+    Returns the id of the bread ingredient whose name is one of the words of
+    `name` (e.g. "Flour" for "all-purpose flour"), if any. `bread_ingredients`
+    maps lower case names to ids.
+    """
+    for word in reversed(re.findall(r"[\w-]+", name)):
+        for candidate in (word, word.removesuffix("s")):
+            if candidate in bread_ingredients:
+                return bread_ingredients[candidate]
+    return None
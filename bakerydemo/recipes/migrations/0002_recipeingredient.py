@@ -0,0 +1,146 @@
+# Generated by Django 5.1.2 on 2026-10-17 22:50
+
+import re
+from html import unescape
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils.html import strip_tags
+
+# A frozen copy of the ingredient extraction of bakerydemo.recipes.ingredients
+# as of this migration, so that later changes to it don't change what the
+# migration does
+UNITS = {
+    "cake", "cakes", "clove", "cloves", "cup", "cups", "g", "gram", "grams",
+    "kg", "l", "large", "lb", "lbs", "medium", "ml", "ounce", "ounces", "oz",
+    "pinch", "pound", "pounds", "small", "tablespoon", "tablespoons", "tbsp",
+    "teaspoon", "teaspoons", "tsp",
+}  # fmt: skip
+QUANTITY_RE = re.compile(r"^[\d¼½¾⅓⅔⅛.,/\s–-]+$")
+PARENTHESES_RE = re.compile(r"\([^)]*\)")
+
+
+def get_item_text(html):
+    return " ".join(unescape(strip_tags(html)).split())
+
+
+def normalise_ingredient(text):
+    text = PARENTHESES_RE.sub(" ", text.lower()).split(",")[0]
+    words = text.split()
+    while words and (QUANTITY_RE.match(words[0]) or words[0] in UNITS):
+        words.pop(0)
+    return " ".join(words)
+
+
+def iter_ingredients_html(stream_data):
+    for block in stream_data:
+        if block["type"] != "ingredients_list":
+            continue
+        for item in block["value"]:
+            yield item["value"] if isinstance(item, dict) else item
+
+
+def extract_ingredients(stream_data):
+    ingredients = []
+    for html in iter_ingredients_html(stream_data):
+        text = get_item_text(html)
+        name = normalise_ingredient(text)
+        if name:
+            ingredients.append((name, text))
+    return ingredients
+
+
+def match_bread_ingredient(name, bread_ingredients):
+    for word in reversed(re.findall(r"[\w-]+", name)):
+        for candidate in (word, word.removesuffix("s")):
+            if candidate in bread_ingredients:
+                return bread_ingredients[candidate]
+    return None
+
+
+def forwards_func(apps, schema_editor):
+    RecipePage = apps.get_model("recipes", "recipepage")
+    RecipeIngredient = apps.get_model("recipes", "recipeingredient")
+    BreadIngredient = apps.get_model("breads", "breadingredient")
+    db_alias = schema_editor.connection.alias
+
+    bread_ingredients = {
+        name.lower(): pk
+        for pk, name in BreadIngredient.objects.using(db_alias).values_list(
+            "pk", "name"
+        )
+    }
+    ingredients = []
+    for recipe in RecipePage.objects.using(db_alias).filter(live=True):
+        for sort_order, (name, text) in enumerate(
+            extract_ingredients(recipe.body.raw_data)
+        ):
+            ingredients.append(
+                RecipeIngredient(
+                    recipe=recipe,
+                    name=name[:255],
+                    text=text,
+                    bread_ingredient_id=match_bread_ingredient(name, bread_ingredients),
+                    sort_order=sort_order,
+                )
+            )
+    RecipeIngredient.objects.using(db_alias).bulk_create(ingredients)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("breads", "0007_alter_breadingredient_options_and_more"),
+        ("recipes", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RecipeIngredient",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255)),
+                ("text", models.TextField()),
+                ("sort_order", models.PositiveIntegerField(default=0)),
+                (
+                    "bread_ingredient",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="recipe_ingredients",
+                        to="breads.breadingredient",
+                    ),
+                ),
+                (
+                    "recipe",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ingredients",
+                        to="recipes.recipepage",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["sort_order"],
+                "indexes": [
+                    models.Index(
+                        fields=["name", "recipe"], name="recipes_rec_name_014c33_idx"
+                    ),
+                    models.Index(
+                        fields=["bread_ingredient", "recipe"],
+                        name="recipes_rec_bread_i_0dedd3_idx",
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(forwards_func, migrations.RunPython.noop),
+    ]
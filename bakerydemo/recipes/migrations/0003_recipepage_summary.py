@@ -0,0 +1,137 @@
+# Generated by Django 5.1.2 on 2026-10-17 23:10
+
+import re
+from html import unescape
+
+from django.db import migrations, models
+from django.utils.html import strip_tags
+
+# A frozen copy of bakerydemo.recipes.summary.summarise_recipe() and of the
+# ingredient extraction of bakerydemo.recipes.ingredients as of this
+# migration, so that later changes to them don't change what the migration
+# does
+DIFFICULTY_LEVELS = {"S": 1, "M": 2, "L": 3}
+UNITS = {
+    "cake", "cakes", "clove", "cloves", "cup", "cups", "g", "gram", "grams",
+    "kg", "l", "large", "lb", "lbs", "medium", "ml", "ounce", "ounces", "oz",
+    "pinch", "pound", "pounds", "small", "tablespoon", "tablespoons", "tbsp",
+    "teaspoon", "teaspoons", "tsp",
+}  # fmt: skip
+QUANTITY_RE = re.compile(r"^[\d¼½¾⅓⅔⅛.,/\s–-]+$")
+PARENTHESES_RE = re.compile(r"\([^)]*\)")
+
+
+def get_item_text(html):
+    return " ".join(unescape(strip_tags(html)).split())
+
+
+def normalise_ingredient(text):
+    text = PARENTHESES_RE.sub(" ", text.lower()).split(",")[0]
+    words = text.split()
+    while words and (QUANTITY_RE.match(words[0]) or words[0] in UNITS):
+        words.pop(0)
+    return " ".join(words)
+
+
+def iter_ingredients_html(stream_data):
+    for block in stream_data:
+        if block["type"] != "ingredients_list":
+            continue
+        for item in block["value"]:
+            yield item["value"] if isinstance(item, dict) else item
+
+
+def extract_ingredients(stream_data):
+    ingredients = []
+    for html in iter_ingredients_html(stream_data):
+        text = get_item_text(html)
+        name = normalise_ingredient(text)
+        if name:
+            ingredients.append((name, text))
+    return ingredients
+
+
+def iter_steps(stream_data):
+    for block in stream_data:
+        if block["type"] != "steps_list":
+            continue
+        for item in block["value"]:
+            if "value" in item and "difficulty" not in item:
+                item = item["value"]
+            yield item
+
+
+def summarise_recipe(stream_data):
+    levels = [
+        DIFFICULTY_LEVELS.get(step.get("difficulty"), DIFFICULTY_LEVELS["S"])
+        for step in iter_steps(stream_data)
+    ]
+    return {
+        "step_count": len(levels),
+        "ingredient_count": len(extract_ingredients(stream_data)),
+        "max_difficulty": max(levels, default=None),
+        "average_difficulty": sum(levels) / len(levels) if levels else None,
+    }
+
+
+SUMMARY_FIELDS = [
+    "step_count",
+    "ingredient_count",
+    "max_difficulty",
+    "average_difficulty",
+]
+
+
+def forwards_func(apps, schema_editor):
+    RecipePage = apps.get_model("recipes", "recipepage")
+    db_alias = schema_editor.connection.alias
+    recipes = list(RecipePage.objects.using(db_alias).only("body"))
+    for recipe in recipes:
+        for field, value in summarise_recipe(recipe.body.raw_data).items():
+            setattr(recipe, field, value)
+    RecipePage.objects.using(db_alias).bulk_update(
+        recipes, SUMMARY_FIELDS, batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0002_recipeingredient"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipepage",
+            name="average_difficulty",
+            field=models.FloatField(
+                blank=True, db_index=True, editable=False, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="recipepage",
+            name="ingredient_count",
+            field=models.PositiveSmallIntegerField(
+                db_index=True, default=0, editable=False
+            ),
+        ),
+        migrations.AddField(
+            model_name="recipepage",
+            name="max_difficulty",
+            field=models.PositiveSmallIntegerField(
+                blank=True,
+                choices=[(1, "Small"), (2, "Medium"), (3, "Large")],
+                db_index=True,
+                editable=False,
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="recipepage",
+            name="step_count",
+            field=models.PositiveSmallIntegerField(
+                db_index=True, default=0, editable=False
+            ),
+        ),
+        migrations.RunPython(forwards_func, migrations.RunPython.noop),
+    ]
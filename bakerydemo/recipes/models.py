@@ -1,4 +1,7 @@
-from django.db import models
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db import models, transaction
+from django.db.models import Count, Prefetch, Q
+from django.db.models.functions import Coalesce, Lower
 from modelcluster.fields import ParentalKey
 from wagtail.admin.panels import (
     FieldPanel,
@@ -11,6 +14,20 @@ from wagtail.models import Orderable, Page
 from wagtail.search import index
 
 from bakerydemo.base.blocks import BaseStreamBlock
+from bakerydemo.base.pagination import (
+    InvalidCursor,
+    KeysetPaginator,
+    get_query_prefix,
+)
+from bakerydemo.breads.models import BreadIngredient
+from bakerydemo.recipes.ingredients import extract_ingredients, match_bread_ingredient
+from bakerydemo.recipes.summary import (
+    DIFFICULTIES,
+    DIFFICULTY_CHOICES,
+    get_difficulty_level,
+    get_summary_filters,
+    summarise_recipe,
+)
 
 from .blocks import RecipeStreamBlock
 
@@ -72,6 +89,21 @@ class RecipePage(Page):
         help_text="The recipe’s step-by-step instructions and any other relevant information.",
     )
 
+    # Summary of the body, computed on save so that recipes can be filtered
+    # without decoding their body, see recipes/summary.py
+    step_count = models.PositiveSmallIntegerField(
+        default=0, editable=False, db_index=True
+    )
+    ingredient_count = models.PositiveSmallIntegerField(
+        default=0, editable=False, db_index=True
+    )
+    max_difficulty = models.PositiveSmallIntegerField(
+        null=True, blank=True, choices=DIFFICULTY_CHOICES, editable=False, db_index=True
+    )
+    average_difficulty = models.FloatField(
+        null=True, blank=True, editable=False, db_index=True
+    )
+
     content_panels = Page.content_panels + [
         FieldPanel("date_published"),
         # Using `title` to make a field larger.
@@ -115,14 +147,112 @@ class RecipePage(Page):
         with a loop on the template. If we tried to access the recipe_person_
         relationship directly we'd print `recipe.RecipePersonRelationship.None`
         """
-        # Only return authors that are not in draft
-        return [
-            n.person
-            for n in self.recipe_person_relationship.filter(
+        # Use the relationships prefetched by get_listing_prefetches(), if any
+        relationships = getattr(self, "live_person_relationships", None)
+        if relationships is None:
+            # Only return authors that are not in draft
+            relationships = self.recipe_person_relationship.filter(
                 person__live=True
             ).select_related("person")
+        return [n.person for n in relationships]
+
+    @staticmethod
+    def get_listing_prefetches():
+        """
+        Returns the prefetches that let a list of recipes show their authors
+        in a constant number of queries, rather than one per recipe.
+        """
+        return [
+            Prefetch(
+                "recipe_person_relationship",
+                queryset=RecipePersonRelationship.objects.filter(
+                    person__live=True
+                ).select_related("person"),
+                to_attr="live_person_relationships",
+            ),
         ]
 
+    def save(self, *args, **kwargs):
+        for field, value in summarise_recipe(self.body.raw_data).items():
+            setattr(self, field, value)
+        super().save(*args, **kwargs)
+
+    def update_ingredients(self):
+        """
+        Replaces the RecipeIngredient rows of this recipe with the ingredients
+        listed in its body. Called when the recipe is published, see
+        recipes/signal_handlers.py.
+        """
+        bread_ingredients = get_bread_ingredient_ids()
+        with transaction.atomic():
+            RecipeIngredient.objects.filter(recipe=self).delete()
+            RecipeIngredient.objects.bulk_create(
+                [
+                    RecipeIngredient(
+                        recipe=self,
+                        name=name[:255],
+                        text=text,
+                        bread_ingredient_id=match_bread_ingredient(
+                            name, bread_ingredients
+                        ),
+                        sort_order=sort_order,
+                    )
+                    for sort_order, (name, text) in enumerate(
+                        extract_ingredients(self.body.raw_data)
+                    )
+                ]
+            )
+
+    # Returns the recipes of the queryset that contain all of the given
+    # ingredients. An ingredient matches by normalised name ("plain flour") or
+    # by bread ingredient ("flour" for any kind of flour).
+    @staticmethod
+    def filter_by_ingredients(recipes, names):
+        for name in names:
+            name = name.lower()
+            recipes = recipes.filter(
+                pk__in=RecipeIngredient.objects.filter(
+                    Q(name=name) | Q(bread_ingredient__name__iexact=name)
+                ).values("recipe")
+            )
+        return recipes
+
+    # Returns the recipes of the queryset whose hardest step has the given
+    # difficulty ("S", "M" or "L"), with at most `max_steps` steps and
+    # `max_ingredients` ingredients, and whose average step difficulty level
+    # is at most `max_average_difficulty` (1 for small to 3 for large), using
+    # the summary fields. Raises ValueError for an unknown difficulty.
+    @staticmethod
+    def filter_by_summary(
+        recipes,
+        difficulty=None,
+        max_steps=None,
+        max_ingredients=None,
+        max_average_difficulty=None,
+    ):
+        if difficulty is not None:
+            recipes = recipes.filter(max_difficulty=get_difficulty_level(difficulty))
+        if max_steps is not None:
+            recipes = recipes.filter(step_count__lte=max_steps)
+        if max_ingredients is not None:
+            recipes = recipes.filter(ingredient_count__lte=max_ingredients)
+        if max_average_difficulty is not None:
+            recipes = recipes.filter(average_difficulty__lte=max_average_difficulty)
+        return recipes
+
+    # Returns the ingredients of the recipes of the queryset as
+    # {"ingredient", "count"} dicts, most used first, with the number of
+    # recipes using each. Ingredients linked to a bread ingredient are
+    # counted under its name.
+    @staticmethod
+    def ingredient_facets(recipes):
+        return (
+            RecipeIngredient.objects.filter(recipe__in=recipes)
+            .values(ingredient=Coalesce(Lower("bread_ingredient__name"), "name"))
+            .annotate(count=Count("recipe", distinct=True))
+            .order_by("-count", "ingredient")
+        )
+
     # Specifies parent to Recipe as being RecipeIndexPages
     parent_page_types = ["RecipeIndexPage"]
 
@@ -131,6 +261,79 @@ class RecipePage(Page):
     subpage_types = []
 
 
+class RecipeIngredient(models.Model):
+    """
+    An ingredient of a published RecipePage, extracted from the
+    `ingredients_list` blocks of its body so that recipes can be queried by
+    ingredient. These rows are derived data: they are rebuilt each time the
+    recipe is published and aren't edited directly.
+    """
+
+    recipe = models.ForeignKey(
+        "RecipePage", related_name="ingredients", on_delete=models.CASCADE
+    )
+    # Normalised name, e.g. "all-purpose flour"
+    name = models.CharField(max_length=255)
+    # The list item as plain text, e.g. "3 cups (720 mL) all-purpose flour"
+    text = models.TextField()
+    bread_ingredient = models.ForeignKey(
+        BreadIngredient,
+        null=True,
+        blank=True,
+        related_name="recipe_ingredients",
+        on_delete=models.SET_NULL,
+    )
+    sort_order = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["sort_order"]
+        indexes = [
+            models.Index(fields=["name", "recipe"]),
+            models.Index(fields=["bread_ingredient", "recipe"]),
+        ]
+
+    def __str__(self):
+        return self.text
+
+
+def get_bread_ingredient_ids():
+    return {
+        name.lower(): pk
+        for pk, name in BreadIngredient.objects.values_list("pk", "name")
+    }
+
+
+def relink_bread_ingredients(names, bread_ingredient_id=None):
+    """
+    Links the recipe ingredients to the bread ingredients again, after a bread
+    ingredient has been added, renamed or deleted. Only the recipe ingredients
+    that mention one of its `names` (old and new), or that are linked to it,
+    can change, so the others aren't looked at.
+    """
+    candidates = Q(pk__in=[])
+    for name in names:
+        if name:
+            candidates |= Q(name__icontains=name)
+    if bread_ingredient_id is not None:
+        candidates |= Q(bread_ingredient_id=bread_ingredient_id)
+    ingredients = list(
+        RecipeIngredient.objects.filter(candidates).only("name", "bread_ingredient")
+    )
+    if not ingredients:
+        return
+
+    # The matching picks among all of the bread ingredients, e.g. when a
+    # recipe ingredient names several of them
+    bread_ingredients = get_bread_ingredient_ids()
+    changed = []
+    for ingredient in ingredients:
+        bread_ingredient_id = match_bread_ingredient(ingredient.name, bread_ingredients)
+        if bread_ingredient_id != ingredient.bread_ingredient_id:
+            ingredient.bread_ingredient_id = bread_ingredient_id
+            changed.append(ingredient)
+    RecipeIngredient.objects.bulk_update(changed, ["bread_ingredient"], batch_size=1000)
+
+
 class RecipeIndexPage(Page):
     """
     Index page for recipe.
@@ -152,12 +355,76 @@ class RecipeIndexPage(Page):
     def children(self):
         return self.get_children().specific().live()
 
-    # Overrides the context to list all child items, that are live, by the
-    # date that they were published
+    # Returns the live RecipePage objects under this index, filtered by the
+    # parameters of the request:
+    # - `ingredient`, for the recipes containing all of the given ingredients
+    #   (e.g. ?ingredient=flour&ingredient=milk)
+    # - `difficulty`, for the recipes whose hardest step has that difficulty
+    #   (S, M or L)
+    # - `max_steps` and `max_ingredients`, for the shorter recipes
+    # - `max_average_difficulty`, for the recipes whose steps are mostly easy
+    #   (e.g. 1.5, between 1 for small and 3 for large)
+    # Invalid difficulties and counts are ignored.
+    def get_recipes(self, request):
+        recipes = RecipePage.filter_by_ingredients(
+            RecipePage.objects.descendant_of(self).live(),
+            request.GET.getlist("ingredient"),
+        )
+        try:
+            filters = get_summary_filters(request.GET)
+        except ValueError:
+            filters = {}
+        return RecipePage.filter_by_summary(recipes, **filters)
+
+    # Set to True to always use cursor pagination. Otherwise it is only used
+    # when the request has a `cursor` parameter.
+    cursor_pagination = False
+
+    # Paginates the recipes by page number or, as on the BreadsIndexPage, by
+    # cursor (see base/pagination.py), with their authors prefetched. The id
+    # breaks ties between recipes published on the same day, so that the
+    # order is stable across pages.
+    def paginate(self, request, recipes):
+        recipes = recipes.order_by("-date_published", "-id").prefetch_related(
+            *RecipePage.get_listing_prefetches()
+        )
+
+        if self.cursor_pagination or "cursor" in request.GET:
+            paginator = KeysetPaginator(
+                recipes, 12, ordering=("-date_published", "-id")
+            )
+            try:
+                return paginator.page(request.GET.get("cursor"))
+            except InvalidCursor:
+                return paginator.page()
+
+        paginator = Paginator(recipes, 12)
+        try:
+            return paginator.page(request.GET.get("page"))
+        except PageNotAnInteger:
+            return paginator.page(1)
+        except EmptyPage:
+            return paginator.page(paginator.num_pages)
+
+    # Overrides the context to list a page of the child items, that are live
+    # and match the filters of the request (see get_recipes), by the date that
+    # they were published, with the ingredients of all the matching recipes
+    # and their counts
     # https://docs.wagtail.org/en/stable/getting_started/tutorial.html#overriding-context
     def get_context(self, request):
         context = super(RecipeIndexPage, self).get_context(request)
-        context["recipes"] = (
-            RecipePage.objects.descendant_of(self).live().order_by("-date_published")
+        recipes = self.get_recipes(request)
+        context["recipes"] = self.paginate(request, recipes)
+        context["selected_ingredients"] = request.GET.getlist("ingredient")
+        context["ingredient_facets"] = RecipePage.ingredient_facets(recipes)
+        context["selected_difficulty"] = request.GET.get("difficulty", "").upper()
+        context["difficulties"] = DIFFICULTIES
+        # Keep the filters in the pagination and filter links
+        context["pagination_query"] = get_query_prefix(request, "page", "cursor")
+        context["difficulty_query"] = get_query_prefix(
+            request, "page", "cursor", "difficulty"
+        )
+        context["ingredient_query"] = get_query_prefix(
+            request, "page", "cursor", "ingredient"
         )
         return context
@@ -0,0 +1,42 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from wagtail.signals import page_published
+
+from bakerydemo.breads.models import BreadIngredient
+from bakerydemo.recipes.models import RecipePage, relink_bread_ingredients
+
+
+def update_recipe_ingredients(sender, instance, **kwargs):
+    instance.update_ingredients()
+
+
+def remember_bread_ingredient_name(sender, instance, update_fields=None, **kwargs):
+    # Revisions and publishing save the snippet without changing its name
+    if instance.pk is None or (
+        update_fields is not None and "name" not in update_fields
+    ):
+        instance._saved_name = instance.name
+    else:
+        instance._saved_name = (
+            sender.objects.filter(pk=instance.pk).values_list("name", flat=True).first()
+        )
+
+
+def update_bread_ingredient_links(sender, instance, created=False, **kwargs):
+    previous_name = getattr(instance, "_saved_name", None)
+    if not created and previous_name == instance.name:
+        return
+    relink_bread_ingredients([previous_name, instance.name], instance.pk)
+
+
+def unlink_bread_ingredient(sender, instance, **kwargs):
+    # The links themselves are cleared by on_delete=SET_NULL, but the recipe
+    # ingredients may match another bread ingredient
+    relink_bread_ingredients([instance.name])
+
+
+def register_signal_handlers():
+    page_published.connect(update_recipe_ingredients, sender=RecipePage)
+
+    pre_save.connect(remember_bread_ingredient_name, sender=BreadIngredient)
+    post_save.connect(update_bread_ingredient_links, sender=BreadIngredient)
+    post_delete.connect(unlink_bread_ingredient, sender=BreadIngredient)
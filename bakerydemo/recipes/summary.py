@@ -0,0 +1,75 @@
+from bakerydemo.recipes.ingredients import extract_ingredients
+
+# The RecipeStepBlock difficulty choices, easiest first, with the levels they
+# are stored as on RecipePage so that they can be compared and averaged
+DIFFICULTIES = [("S", 1, "Small"), ("M", 2, "Medium"), ("L", 3, "Large")]
+DIFFICULTY_LEVELS = {code: level for code, level, _ in DIFFICULTIES}
+DIFFICULTY_CHOICES = [(level, label) for _, level, label in DIFFICULTIES]
+
+
+def get_difficulty_level(value):
+    """
+    Returns the level of a difficulty choice ("S", "M" or "L", in any case).
+    Raises ValueError for anything else.
+    """
+    try:
+        return DIFFICULTY_LEVELS[value.upper()]
+    except (AttributeError, KeyError):
+        raise ValueError(f"Unknown difficulty: {value!r}")
+
+
+def get_summary_filters(params):
+    """
+    Returns the `RecipePage.filter_by_summary()` arguments given in the query
+    parameters `params` (`difficulty`, `max_steps`, `max_ingredients` and
+    `max_average_difficulty`). Raises ValueError if one of them isn't valid.
+    """
+    filters = {}
+    if params.get("difficulty"):
+        get_difficulty_level(params["difficulty"])
+        filters["difficulty"] = params["difficulty"]
+    for name in ("max_steps", "max_ingredients"):
+        if params.get(name):
+            filters[name] = int(params[name])
+            if filters[name] < 0:
+                raise ValueError(f"{name} can't be negative")
+    if params.get("max_average_difficulty"):
+        # A level between 1 (all steps small) and 3 (all steps large)
+        filters["max_average_difficulty"] = float(params["max_average_difficulty"])
+        if not 0 <= filters["max_average_difficulty"] < float("inf"):
+            raise ValueError("max_average_difficulty must be a non-negative number")
+    return filters
+
+
+def iter_steps(stream_data):
+    """
+    Yields the values (`{"text", "difficulty"}` dicts) of the steps of the
+    `steps_list` blocks of the raw data of a `RecipeStreamBlock` StreamField.
+    """
+    for block in stream_data:
+        if block["type"] != "steps_list":
+            continue
+        for item in block["value"]:
+            # As for ingredients, items may or may not be wrapped in a
+            # {"type": "item", "value": ...} dict
+            if "value" in item and "difficulty" not in item:
+                item = item["value"]
+            yield item
+
+
+def summarise_recipe(stream_data):
+    """
+    Returns the step count, ingredient count, and maximum and average step
+    difficulty levels (None without steps) of the raw data of a
+    `RecipeStreamBlock` StreamField, as a dict of RecipePage field values.
+    """
+    levels = [
+        DIFFICULTY_LEVELS.get(step.get("difficulty"), DIFFICULTY_LEVELS["S"])
+        for step in iter_steps(stream_data)
+    ]
+    return {
+        "step_count": len(levels),
+        "ingredient_count": len(extract_ingredients(stream_data)),
+        "max_difficulty": max(levels, default=None),
+        "average_difficulty": sum(levels) / len(levels) if levels else None,
+    }
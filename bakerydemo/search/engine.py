@@ -0,0 +1,92 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Page as PaginatorPage
+from django.core.paginator import Paginator
+from wagtail.models import Page
+
+from bakerydemo.base.cache import bump_generation, get_generation
+from bakerydemo.blog.models import BlogPage
+from bakerydemo.breads.models import BreadPage
+from bakerydemo.locations.models import LocationPage
+
+# The page types searched when we aren't using ElasticSearch, see search_pages
+SEARCHABLE_PAGE_TYPES = (BlogPage, BreadPage, LocationPage)
+
+SEARCH_RESULTS_CACHE_TIMEOUT = 60 * 10
+SEARCH_RESULTS_CACHE_KEY = "bakerydemo:search:{}:{}:{}:{}"
+
+
+def search_pages(search_query):
+    """
+    Returns the live pages matching `search_query`, ordered by relevance.
+
+    The results are lazy: slicing them (e.g. through a Paginator) only runs
+    the search for the requested slice, and only the pages of that slice are
+    loaded as their specific page type.
+    """
+    pages = Page.objects.live()
+    if "elasticsearch" not in settings.WAGTAILSEARCH_BACKENDS["default"]["BACKEND"]:
+        # If we aren't using ElasticSearch for the demo, fall back to native
+        # db search, restricted to the page types we want to search. As the
+        # restriction is a content type filter, all of them are searched in
+        # a single ranked query.
+        pages = pages.type(*SEARCHABLE_PAGE_TYPES)
+    # In production, use ElasticSearch and a simplified search query, per
+    # https://docs.wagtail.org/en/stable/topics/search/backends.html
+    return pages.specific().search(search_query)
+
+
+def normalise_search_query(search_query):
+    # Case-fold and collapse whitespace so that "Bread", "bread " and
+    # "BREAD" share their cached results
+    return " ".join(search_query.casefold().split())
+
+
+def get_search_results_page(search_query, page_number, per_page):
+    """
+    Returns the `page_number` page of the results of `search_query`, as a
+    `django.core.paginator.Page` of specific pages.
+
+    The total count and the ordered IDs of the pages of each results page
+    are cached, so a repeated search costs a cache lookup and a query for
+    the pages that are displayed. Cached results are dropped when any page
+    is published, unpublished or moved.
+    """
+    search_query = normalise_search_query(search_query)
+    try:
+        page_number = int(page_number)
+    except (TypeError, ValueError):
+        page_number = 1
+
+    key = SEARCH_RESULTS_CACHE_KEY.format(
+        get_generation("search_results"),
+        hashlib.md5(search_query.encode()).hexdigest(),
+        per_page,
+        page_number,
+    )
+    paginator = Paginator(search_pages(search_query), per_page)
+    cached = cache.get(key)
+
+    if cached is None:
+        # Out of range page numbers fall back to the first or last page
+        results_page = paginator.get_page(page_number)
+        cache.set(
+            key,
+            (paginator.count, results_page.number, [page.pk for page in results_page]),
+            SEARCH_RESULTS_CACHE_TIMEOUT,
+        )
+        return results_page
+
+    count, number, page_ids = cached
+    # Prevent the paginator from counting the search results again
+    paginator.count = count
+    pages = Page.objects.live().specific().in_bulk(page_ids)
+    return PaginatorPage(
+        [pages[pk] for pk in page_ids if pk in pages], number, paginator
+    )
+
+
+def invalidate_search_results():
+    bump_generation("search_results")
@@ -0,0 +1,125 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from wagtail.contrib.search_promotions.models import Query, QueryDailyHits
+from wagtail.search.utils import normalise_query_string
+
+logger = logging.getLogger(__name__)
+
+# How often (in seconds) the buffered hits are written, and how many distinct
+# queries can be buffered before they are written early.
+FLUSH_INTERVAL = 30
+MAX_PENDING_QUERIES = 500
+
+
+def save_hits(hits):
+    """
+    Adds the `(query_string, date) -> count` hits to the daily hits of the
+    search promotions `Query` model.
+
+    This is the bulk equivalent of calling `Query.get(query_string).add_hit()`
+    `count` times, in a fixed number of queries.
+    """
+    query_strings = {query_string for query_string, _ in hits}
+    with transaction.atomic():
+        Query.objects.bulk_create(
+            [Query(query_string=query_string) for query_string in query_strings],
+            ignore_conflicts=True,
+        )
+        query_ids = dict(
+            Query.objects.filter(query_string__in=query_strings).values_list(
+                "query_string", "id"
+            )
+        )
+        QueryDailyHits.objects.bulk_create(
+            [
+                QueryDailyHits(query_id=query_ids[query_string], date=date)
+                for query_string, date in hits
+            ],
+            ignore_conflicts=True,
+        )
+
+        # Increment the counters in the database rather than overwriting them,
+        # grouping the rows that get the same increment in a single UPDATE.
+        increments = defaultdict(list)
+        for (query_string, date), count in hits.items():
+            increments[date, count].append(query_ids[query_string])
+        for (date, count), ids in increments.items():
+            QueryDailyHits.objects.filter(query_id__in=ids, date=date).update(
+                hits=F("hits") + count
+            )
+
+
+class SearchHitBuffer:
+    """
+    Counts search hits in memory and writes them to the database in bulk, so
+    that recording a hit doesn't cost any query in the request.
+
+    The hits are written at the end of the first request to finish after
+    `flush_interval` seconds, or once `max_pending` distinct queries are
+    buffered (see search/signal_handlers.py), after the response was sent.
+    They are only kept in the memory of the process until then, and written
+    when it exits normally. If the process is killed, the hits it buffered
+    are lost: those of the last `flush_interval` seconds, or all of those
+    since its last request if it was idle.
+    """
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL, max_pending=MAX_PENDING_QUERIES):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._hits = Counter()
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def add(self, query_string, date=None):
+        if date is None:
+            date = timezone.now().date()
+        with self._lock:
+            self._hits[normalise_query_string(query_string), date] += 1
+
+    def is_due(self):
+        with self._lock:
+            pending = len(self._hits)
+        return pending > 0 and (
+            pending >= self.max_pending
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        )
+
+    def flush(self):
+        """
+        Writes the buffered hits to the database, returning the number of
+        queries they were buffered for. Hits that fail to be written are put
+        back into the buffer to be retried on the next flush.
+        """
+        with self._lock:
+            hits, self._hits = self._hits, Counter()
+            self._last_flush = time.monotonic()
+        if not hits:
+            return 0
+        try:
+            save_hits(hits)
+        except Exception:
+            logger.exception("Could not save %d search hits", sum(hits.values()))
+            with self._lock:
+                self._hits.update(hits)
+            return 0
+        return len(hits)
+
+    def flush_if_due(self):
+        return self.flush() if self.is_due() else 0
+
+
+hit_buffer = SearchHitBuffer()
+
+# Write whatever is left when the process exits normally
+atexit.register(hit_buffer.flush)
+
+
+def record_hit(query_string):
+    hit_buffer.add(query_string)
@@ -0,0 +1,22 @@
+from django.core.signals import request_finished
+from wagtail.signals import page_published, page_unpublished, post_page_move
+
+from bakerydemo.search.engine import invalidate_search_results
+from bakerydemo.search.hits import hit_buffer
+
+
+def invalidate_search(sender, **kwargs):
+    invalidate_search_results()
+
+
+def flush_search_hits(sender, **kwargs):
+    # Write the buffered search hits once they are due, after the response
+    # was sent, see SearchHitBuffer in search/hits.py
+    hit_buffer.flush_if_due()
+
+
+def register_signal_handlers():
+    page_published.connect(invalidate_search)
+    page_unpublished.connect(invalidate_search)
+    post_page_move.connect(invalidate_search)
+    request_finished.connect(flush_search_hits)
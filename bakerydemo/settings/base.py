@@ -183,6 +183,24 @@ if "mysql://" in env("DJANGO_DATABASE_URL", default="sqlite:///bakerydemodb"):
         )
     }
 
+# CACHE:
+# Le cache par défaut garde, en plus des fragments de pages et des réponses de
+# l'API, les jetons de génération qui invalident ces entrées (voir
+# bakerydemo/base/cache.py). Avec un cache local à chaque processus, une
+# modification n'invalide que le cache du processus qui l'a enregistrée : dès
+# que le site est servi par plusieurs processus, il faut un cache partagé.
+# La configuration utilise une variable d'environnement sous forme d'URL nommée
+# DJANGO_CACHE_URL, par exemple:
+# - REDIS: rediscache://HOST:PORT/DB
+# - FICHIERS: filecache:///CHEMIN (partagé par les processus d'une machine)
+# - MEMOIRE LOCALE: locmemcache:// (un seul processus, pour le développement)
+# Le cache des réponses de l'API et leurs en-têtes ETag ne sont activés
+# qu'avec un cache partagé.
+# https://docs.djangoproject.com/fr/5.1/ref/settings/#caches
+CACHES = {
+    "default": env.cache("DJANGO_CACHE_URL", default="locmemcache://"),
+}
+
 # Type de champ clé primaire à utiliser par défaut pour les modèles n’ayant
 # pas de champ avec primary_key=True.
 # https://docs.djangoproject.com/fr/5.1/ref/settings/#std:setting-DEFAULT_AUTO_FIELD
@@ -11,6 +11,8 @@ https://docs.djangoproject.com/fr/5.1/ref/settings/
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 from .base import *  # noqa: F403
 from .base import BASE_DIR
 from .base import env
@@ -54,6 +56,23 @@ DATABASES = {"default": env.db("DJANGO_DATABASE_URL")}
 # de création de nouvelles connexions à chaque requête.
 DATABASES["default"]["CONN_MAX_AGE"] = env.int("CONN_MAX_AGE", default=60)
 
+# CACHE:
+# En production, le site est servi par plusieurs processus qui doivent
+# partager le même cache pour que les modifications des éditeurs invalident
+# les pages et les réponses de l'API dans tous les processus (voir
+# bakerydemo/base/cache.py). La variable DJANGO_CACHE_URL est donc obligatoire
+# et doit désigner un cache partagé, par exemple rediscache://HOST:PORT/DB.
+# https://docs.djangoproject.com/fr/5.1/ref/settings/#caches
+CACHES = {"default": env.cache("DJANGO_CACHE_URL")}
+
+if CACHES["default"]["BACKEND"] in (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+):
+    raise ImproperlyConfigured(
+        "DJANGO_CACHE_URL must point to a cache shared by all processes."
+    )
+
 # SECURITE
 # La variable SECURE_PROXY_SSL_HEADER est utilisée dans Django pour indiquer
 # que l'application est derrière un proxy inverse (comme Nginx ou un load